@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+詞彙分行效能測試（FileProcessor._reconstruct_text_from_words）
+以合成的高密度頁面比較單趟分行與舊版「每個詞都重新排序整行」的寫法，並確認兩者輸出相同。
+
+執行：python benchmarks/bench_line_grouping.py
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.file_processor import FileProcessor
+
+LINES_PER_PAGE = 60
+WORDS_PER_LINE = (50, 200, 800)
+REPEAT = 3
+
+
+def legacy_reconstruct_text_from_words(words: list) -> str:
+    """舊版實作：每加入一個詞就重新排序目前的行以找出最右邊的詞（每行 O(n² log n)）"""
+    if not words:
+        return ""
+    words.sort(key=lambda w: (w['top'], w['x0']))
+    lines = []
+    current_line = [words[0]]
+    line_tolerance = 2
+    for i in range(1, len(words)):
+        last_word_in_line = sorted(current_line, key=lambda w: w['x0'])[-1]
+        current_word = words[i]
+        if abs(current_word['top'] - last_word_in_line['top']) <= line_tolerance:
+            current_line.append(current_word)
+        else:
+            lines.append(sorted(current_line, key=lambda w: w['x0']))
+            current_line = [current_word]
+    lines.append(sorted(current_line, key=lambda w: w['x0']))
+
+    base_indent = min(line[0]['x0'] for line in lines if line)
+    full_text_content = []
+    for line_words in lines:
+        num_spaces = int(round((line_words[0]['x0'] - base_indent) / 5))
+        full_text_content.append(' ' * num_spaces + ' '.join(w['text'] for w in line_words))
+    return "\n".join(full_text_content)
+
+
+def make_page(words_per_line: int, seed: int = 0) -> list:
+    """產生一頁合成詞彙：每行 top 有 ±1 的抖動、x0 隨機縮排，順序打亂"""
+    rng = random.Random(seed)
+    words = []
+    for line in range(LINES_PER_PAGE):
+        top = line * 12.0
+        x = rng.choice((0, 0, 20, 40))
+        for i in range(words_per_line):
+            words.append({'text': f"w{line}_{i}", 'x0': float(x), 'top': top + rng.uniform(-1, 1)})
+            x += rng.randint(8, 30)
+    rng.shuffle(words)
+    return words
+
+
+def time_call(func, words: list) -> float:
+    """回傳 REPEAT 次中最快的一次（毫秒）；每次都傳入新的串列，避免排序結果被重複利用"""
+    best = float('inf')
+    for _ in range(REPEAT):
+        copy = [dict(w) for w in words]
+        start = time.perf_counter()
+        func(copy)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    print(f"每頁 {LINES_PER_PAGE} 行，取 {REPEAT} 次中最快的結果")
+    print(f"{'詞/行':>8} {'詞數':>8} {'舊版 (ms)':>12} {'單趟 (ms)':>12} {'加速':>8}")
+    for words_per_line in WORDS_PER_LINE:
+        words = make_page(words_per_line, seed=words_per_line)
+        expected = legacy_reconstruct_text_from_words([dict(w) for w in words])
+        actual = FileProcessor._reconstruct_text_from_words([dict(w) for w in words])
+        if actual != expected:
+            raise SystemExit(f"輸出不一致（每行 {words_per_line} 詞）")
+
+        legacy_ms = time_call(legacy_reconstruct_text_from_words, words)
+        current_ms = time_call(FileProcessor._reconstruct_text_from_words, words)
+        print(f"{words_per_line:>8} {len(words):>8} {legacy_ms:>12.1f} {current_ms:>12.1f} {legacy_ms / current_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
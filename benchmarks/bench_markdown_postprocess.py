@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Markdown 後處理吞吐量測試（src/utils/markdown_utils.py）
+以合成的長篇解答比較單趟逐行處理與舊版多次分割、每行重新編譯正則的寫法，
+並先以隨機片段確認兩者輸出相同。
+
+執行：python benchmarks/bench_markdown_postprocess.py [--samples 4000]
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils import markdown_utils
+from src.utils.markdown_utils import guess_programming_language
+
+ANSWER_LINES = (1000, 10000, 100000)
+REPEAT = 3
+
+# 舊版 format_code_blocks 的正則會把裸 ``` 後的空白行或單字首行當成語言名稱，
+# 新版只讀取 ``` 同一行的語言；含這類片段的輸入不列入比對。
+LEGACY_FENCE_QUIRK = re.compile(r"```\s*\n\s*\w+\n|```[ \t]*\n[ \t]*\n")
+ANSWER_HEADING = r"^\s*(答案|解答|參考答案|建議|說明|解析)[\s:：]"
+
+
+def legacy_detect_and_fence_indented_code(text: str) -> str:
+    """舊版實作：緩衝區每次都重新 join 並以未編譯的正則檢查"""
+    if not text:
+        return text
+    result = []
+    buffer = []
+    in_fence = False
+
+    def flush_buffer():
+        nonlocal buffer
+        if buffer:
+            is_code_block = False
+            indent_check = False
+            if len(buffer) >= 2:
+                block_text = "\n".join(buffer)
+                indent_check = all(re.match(r"^( |\t){2,}", line) for line in buffer if line.strip())
+                keyword_check = re.search(
+                    r"\b(for|if|while|BEGIN|END|PRINT|READ|FUNCTION|PROCEDURE|RETURN|DECLARE|SET|GET|CALL|LOOP|UNTIL|DO|THEN|ELSE|ELIF|CASE|SWITCH|BREAK|CONTINUE|EXIT|INPUT|OUTPUT)\b",
+                    block_text, re.IGNORECASE)
+                is_code_block = bool(indent_check or keyword_check)
+            if is_code_block:
+                result.append("```pseudocode")
+                if not indent_check:
+                    result.extend("    " + line.lstrip() if line.lstrip() else "" for line in buffer)
+                else:
+                    result.extend(buffer)
+                result.append("```")
+            else:
+                result.extend(buffer)
+            buffer = []
+
+    for line in text.splitlines():
+        if line.strip().startswith("```"):
+            flush_buffer()
+            in_fence = not in_fence
+            result.append(line)
+            continue
+        if not in_fence and re.match(r"^(\t| {4,})", line):
+            buffer.append(line)
+        else:
+            flush_buffer()
+            result.append(line)
+    flush_buffer()
+    return "\n".join(result)
+
+
+def legacy_format_code_blocks(text: str) -> str:
+    """舊版實作：先圍起縮排程式碼，再對整份文字做一次跨行的 re.sub"""
+    text = legacy_detect_and_fence_indented_code(text)
+
+    def replace_code_block(match):
+        lang = match.group(1) or guess_programming_language(match.group(2))
+        return f"```{lang}\n{match.group(2)}```"
+
+    return re.sub(r"```\s*(\w+)?\n([\s\S]*?)```", replace_code_block, text, flags=re.DOTALL)
+
+
+def legacy_sanitize_question_text(text: str) -> str:
+    """舊版流程：移除解答標題行、join 後 strip，再交給 detect_and_fence_indented_code 重新分割"""
+    if not text:
+        return text
+    pattern = re.compile(ANSWER_HEADING, re.I)
+    lines = []
+    in_code_block = False
+    for line in text.splitlines():
+        if line.strip().startswith("```"):
+            in_code_block = not in_code_block
+            lines.append(line)
+        elif in_code_block or not pattern.match(line):
+            lines.append(line)
+    return legacy_detect_and_fence_indented_code("\n".join(lines).strip())
+
+
+def legacy_fix_markdown_numbering(text: str) -> str:
+    """舊版實作：每個編號行都往回重新比對前 4 行"""
+    if not text:
+        return text
+    lines = text.split('\n')
+    result_lines = []
+    for i, line in enumerate(lines):
+        arabic_match = re.match(r'^(\s*)(\d+)\.\s+(.+)$', line)
+        if arabic_match:
+            indent, old_number, content = arabic_match.groups()
+            for j in range(i - 1, max(-1, i - 5), -1):
+                if j < 0 or not lines[j].strip():
+                    continue
+                prev_match = re.match(r'^(\s*)(\d+)\.\s+', lines[j])
+                if prev_match:
+                    prev_indent, prev_number = prev_match.groups()
+                    if len(prev_indent) == len(indent):
+                        if int(old_number) == int(prev_number):
+                            line = f"{indent}{int(prev_number) + 1}. {content}"
+                        break
+        result_lines.append(line)
+    return '\n'.join(result_lines)
+
+
+PIECES = [
+    "### 解答", "答案：這是答案", "說明: 一些說明", "  ", "", "    ", "一般敘述文字，包含 for 迴圈的說明。",
+    "1. 第一點", "1. 重複編號", "2. 第二點", "   1. 子項目", "   1. 子項目重複", "3. 第三點",
+    "    for i in range(10):", "        print(i)", "\tBEGIN", "\tREAD x", "    x ← x - 1", "    END",
+    "```", "```python", "``` sql", "```\tjava", "  ```", "def foo():", "    return 1", "SELECT * FROM t WHERE a = 1",
+    "| a | b |", "|---|---|", "| 1 | 2 |", "> 引用", "- 項目", "{\"a\": 1}", "#include <stdio.h>", "int main() {", "}",
+]
+
+
+def make_snippet(rng: random.Random) -> str:
+    """由常見的題目 / 解答片段隨機組成 1–40 行的文字"""
+    lines = [rng.choice(PIECES) for _ in range(rng.randint(1, 40))]
+    return "\n".join(lines) + rng.choice(["", "\n", "  \n\n"])
+
+
+def make_answer(rng: random.Random, line_count: int) -> str:
+    """產生約 line_count 行的長篇解答：程式碼區塊、縮排虛擬碼、編號清單與段落交錯"""
+    blocks = []
+    lines = 0
+    while lines < line_count:
+        choice = rng.random()
+        if choice < 0.3:
+            block = "```\n" + "\n".join(f"    x{i} = x{i - 1} + {i}" for i in range(rng.randint(5, 30))) + "\n```"
+        elif choice < 0.5:
+            block = "\n".join(f"    for i in range({j}):\n        total += i" for j in range(rng.randint(2, 8)))
+        elif choice < 0.7:
+            block = "\n".join(f"{j}. 第 {j} 個重點，說明演算法的時間複雜度 O(n log n)。" for j in range(1, rng.randint(3, 10)))
+        else:
+            block = "本段說明資料結構與演算法的概念，並比較不同實作的優缺點。" * rng.randint(1, 4)
+        blocks.append(block)
+        lines += block.count("\n") + 2
+    return "\n\n".join(blocks)
+
+
+def check_equivalence(samples: int):
+    """逐一比對新舊實作的輸出，不一致時印出第一個反例並結束"""
+    rng = random.Random(1)
+    pairs = [
+        ('detect_and_fence_indented_code', legacy_detect_and_fence_indented_code,
+         markdown_utils.detect_and_fence_indented_code),
+        ('sanitize_question_text', legacy_sanitize_question_text, markdown_utils.sanitize_question_text),
+        ('fix_markdown_numbering', legacy_fix_markdown_numbering, markdown_utils.fix_markdown_numbering),
+    ]
+    skipped = 0
+    for _ in range(samples):
+        text = make_snippet(rng)
+        for name, legacy, current in pairs:
+            if legacy(text) != current(text):
+                raise SystemExit(f"{name} 輸出不一致：{text!r}")
+        if LEGACY_FENCE_QUIRK.search(legacy_detect_and_fence_indented_code(text)):
+            skipped += 1
+        elif legacy_format_code_blocks(text) != markdown_utils.format_code_blocks(text):
+            raise SystemExit(f"format_code_blocks 輸出不一致：{text!r}")
+    print(f"比對 {samples} 個隨機片段：輸出一致（format_code_blocks 略過 {skipped} 個裸 ``` 語言誤判的片段）")
+
+
+def best_of(func, text: str) -> float:
+    """回傳 REPEAT 次中最快的一次（毫秒）"""
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=4000, help='等價性比對的隨機片段數')
+    args = parser.parse_args()
+
+    check_equivalence(args.samples)
+
+    rng = random.Random(2)
+    print(f"\n取 {REPEAT} 次中最快的結果")
+    print(f"{'行數':>8} {'大小 (KiB)':>11} {'函式':<22} {'舊版 (ms)':>12} {'單趟 (ms)':>12} {'加速':>8}")
+    for line_count in ANSWER_LINES:
+        text = markdown_utils.format_answer_text(make_answer(rng, line_count))
+        for name, legacy, current in (
+            ('format_code_blocks', legacy_format_code_blocks, markdown_utils.format_code_blocks),
+            ('fix_markdown_numbering', legacy_fix_markdown_numbering, markdown_utils.fix_markdown_numbering),
+        ):
+            legacy_ms = best_of(legacy, text)
+            current_ms = best_of(current, text)
+            print(f"{line_count:>8} {len(text.encode()) / 1024:>11.0f} {name:<22} "
+                  f"{legacy_ms:>12.1f} {current_ms:>12.1f} {legacy_ms / current_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Markdown 轉 HTML 的每次渲染開銷測試（MarkdownRendererPool）
+比較每次都建立新的 markdown.Markdown 與從池中借用、用完 reset() 的渲染器，
+並以多執行緒同時渲染確認池化輸出與全新渲染器完全相同（包含參考式連結）。
+
+需要 markdown 與 pygments（codehilite）。
+執行：python benchmarks/bench_markdown_render.py [--threads 8] [--rounds 50]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import markdown
+
+from src.utils.render_cache import MARKDOWN_EXTENSIONS, MarkdownRendererPool
+
+SHORT_ANSWER = (
+    "### 題目\n\n請說明下列程式的輸出：\n\n```python\nfor i in range(3):\n    print(i)\n```\n\n"
+    "| a | b |\n|---|---|\n| 1 | 2 |\n[ref]: http://example.com\n"
+)
+LONG_ANSWER = SHORT_ANSWER * 40
+# 參考式連結的定義存在渲染器的 references 中，沒有 reset() 就會洩漏到下一份文件
+REFERENCE_ONLY = "[x][ref]\n"
+PLAIN = "plain"
+
+
+def render_fresh(text: str) -> str:
+    """舊版寫法：每次渲染都建立新的 Markdown 物件並重新載入擴充套件"""
+    return markdown.Markdown(extensions=MARKDOWN_EXTENSIONS).convert(text)
+
+
+def per_render_ms(func, text: str, count: int) -> float:
+    """暖機一次後平均 count 次渲染的耗時（毫秒）"""
+    func(text)
+    start = time.perf_counter()
+    for _ in range(count):
+        func(text)
+    return (time.perf_counter() - start) / count * 1000
+
+
+def check_threads(pool: MarkdownRendererPool, threads: int, rounds: int):
+    """多個執行緒同時向池借用渲染器，逐一與全新渲染器的輸出比對"""
+    expected = {text: render_fresh(text) for text in (SHORT_ANSWER, LONG_ANSWER, REFERENCE_ONLY, PLAIN)}
+    mismatches = []
+
+    def worker():
+        for _ in range(rounds):
+            for text, html in expected.items():
+                if pool.convert(text) != html:
+                    mismatches.append(text[:20])
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    total = threads * rounds * len(expected)
+    print(f"{threads} 個執行緒共渲染 {total} 次：{len(mismatches)} 次與全新渲染器不一致")
+    if mismatches:
+        raise SystemExit(f"池化渲染輸出不一致：{mismatches[:3]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=50, help='每個執行緒渲染每份文件的次數')
+    args = parser.parse_args()
+
+    pool = MarkdownRendererPool(max_idle=args.threads)
+
+    start = time.perf_counter()
+    for _ in range(200):
+        markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    print(f"只建立 Markdown 物件：{(time.perf_counter() - start) / 200 * 1000:.2f} ms")
+
+    print(f"{'文件':<8} {'大小 (KiB)':>11} {'每次新建 (ms)':>15} {'池化 (ms)':>12} {'加速':>8}")
+    for name, text, count in (('短解答', SHORT_ANSWER, 500), ('長解答', LONG_ANSWER, 30)):
+        fresh_ms = per_render_ms(render_fresh, text, count)
+        pooled_ms = per_render_ms(pool.convert, text, count)
+        print(f"{name:<8} {len(text.encode()) / 1024:>11.1f} {fresh_ms:>15.2f} {pooled_ms:>12.2f} {fresh_ms / pooled_ms:>7.1f}x")
+
+    check_threads(pool, args.threads, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+網頁內容擷取延遲測試（PlaywrightScraper._extract_page_content）
+以本機 HTTP 伺服器提供 fixtures/ 中保存的 HTML，比較單一次 page.evaluate 的擷取腳本
+與舊版逐一選擇器、逐項呼叫 page.evaluate（每次都是一趟 CDP 往返）的擷取方式。
+
+需要 playwright 與 Chromium（playwright install chromium）。
+執行：python benchmarks/bench_page_extraction.py [--iterations 20] [--executable-path /path/to/chrome]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playwright.async_api import async_playwright
+
+from src.utils.playwright_scraper import PlaywrightScraper
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FIXTURES = ('article.html', 'tables.html', 'images.html')
+
+# 舊版 _remove_unwanted_elements 與 _extract_main_content 使用的選擇器
+LEGACY_UNWANTED_SELECTORS = [
+    'script', 'style', 'noscript', '.advertisement', '.ads', '.ad', '.sidebar', '.footer',
+    '.header-ads', '.popup', '.modal', '.cookie-notice',
+    '[class*="ad-"]', '[id*="ad-"]', '[class*="ads-"]', '[id*="ads-"]'
+]
+LEGACY_CONTENT_SELECTORS = [
+    'main', 'article', '.content', '.main-content', '.post-content', '.article-content',
+    '.entry-content', '#content', '#main', '.container .row', '.content-wrapper'
+]
+LEGACY_TEXT_SCRIPT = """
+() => {
+    document.querySelectorAll('script, style, noscript, .ad, .ads, .advertisement').forEach(el => el.remove());
+    for (const selector of ['main', 'article', '.content', '.main-content', '#content']) {
+        const element = document.querySelector(selector);
+        if (element) return element.innerText || element.textContent;
+    }
+    return document.body.innerText || document.body.textContent || "";
+}
+"""
+LEGACY_TABLES_SCRIPT = """
+() => Array.from(document.querySelectorAll('table')).map((table, index) => {
+    const headers = Array.from(table.querySelectorAll('th')).map(th => th.textContent.trim());
+    const rows = Array.from(table.querySelectorAll('tr'))
+        .map(row => Array.from(row.querySelectorAll('td, th')).map(cell => cell.textContent.trim()))
+        .filter(row => row.length > 0);
+    let markdown = '';
+    if (headers.length > 0) {
+        markdown += '| ' + headers.join(' | ') + ' |\\n';
+        markdown += '| ' + headers.map(() => '---').join(' | ') + ' |\\n';
+    }
+    rows.forEach(row => { markdown += '| ' + row.join(' | ') + ' |\\n'; });
+    return {index: index, headers: headers, rows: rows, markdown: markdown};
+})
+"""
+LEGACY_IMAGES_SCRIPT = """
+() => Array.from(document.querySelectorAll('img')).map(img => ({
+    src: img.src || '', alt: img.alt || '', title: img.title || '',
+    width: img.naturalWidth || img.width || 0, height: img.naturalHeight || img.height || 0
+})).filter(img => img.src && !img.src.startsWith('data:'))
+"""
+
+
+async def legacy_extract_page_content(page) -> dict:
+    """舊版流程：標題、每個要移除的選擇器、每個內容選擇器、文字、表格、圖片各一次 evaluate"""
+    title = await page.title()
+    for selector in LEGACY_UNWANTED_SELECTORS:
+        await page.evaluate(f"(() => {{ document.querySelectorAll({json.dumps(selector)}).forEach(el => el.remove()); }})()")
+
+    content = ""
+    for selector in LEGACY_CONTENT_SELECTORS:
+        html = await page.evaluate(
+            f"(() => {{ const el = document.querySelector({json.dumps(selector)}); return el ? el.innerHTML : null; }})()")
+        if html and len(html.strip()) > 100:
+            content = html
+            break
+    else:
+        content = await page.evaluate("(() => { const body = document.querySelector('body'); return body ? body.innerHTML : ''; })()")
+
+    text_content = PlaywrightScraper._clean_text(await page.evaluate(LEGACY_TEXT_SCRIPT))
+    tables = await page.evaluate(LEGACY_TABLES_SCRIPT)
+    images = await page.evaluate(LEGACY_IMAGES_SCRIPT)
+    return {'title': title, 'content': content, 'text_content': text_content, 'tables': tables, 'images': images}
+
+
+def start_fixture_server() -> ThreadingHTTPServer:
+    """在隨機埠啟動提供 fixtures/ 的本機 HTTP 伺服器"""
+    handler = partial(SimpleHTTPRequestHandler, directory=FIXTURES_DIR)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def measure(page, url: str, extract, iterations: int) -> list:
+    """每次都重新載入頁面（擷取會移除元素），只計算擷取本身的時間（毫秒）"""
+    samples = []
+    for _ in range(iterations):
+        await page.goto(url, wait_until='load')
+        start = time.perf_counter()
+        await extract(page)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+async def run(iterations: int, executable_path: str = None):
+    server = start_fixture_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    scraper = PlaywrightScraper()
+
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True, executable_path=executable_path)
+            page = await browser.new_page()
+
+            print(f"每個頁面擷取 {iterations} 次，取中位數")
+            print(f"{'頁面':<14} {'舊版 (ms)':>12} {'單次 evaluate (ms)':>20} {'加速':>8}  文字一致")
+            for fixture in FIXTURES:
+                url = f"{base_url}/{fixture}"
+                legacy = await measure(page, url, legacy_extract_page_content, iterations)
+                current = await measure(page, url, scraper._extract_page_content, iterations)
+
+                await page.goto(url, wait_until='load')
+                legacy_text = (await legacy_extract_page_content(page))['text_content']
+                await page.goto(url, wait_until='load')
+                current_text = (await scraper._extract_page_content(page))['text_content']
+
+                legacy_ms = statistics.median(legacy)
+                current_ms = statistics.median(current)
+                print(f"{fixture:<14} {legacy_ms:>12.2f} {current_ms:>20.2f} {legacy_ms / current_ms:>7.1f}x  "
+                      f"{'是' if legacy_text == current_text else '否'}")
+
+            await browser.close()
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--executable-path', default=None, help='使用指定的 Chromium / Chrome 執行檔')
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations, args.executable_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,7 @@ from contextlib import contextmanager
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, inspect, text
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base, joinedload
 from sqlalchemy.pool import StaticPool
 from dotenv import load_dotenv
@@ -40,6 +40,7 @@ class Document(Base):
     file_path = Column(String(1024), nullable=True)
     tags = Column(String(512), nullable=True)
     source = Column(String(2048), nullable=True) # For URLs
+    content_hash = Column(String(64), nullable=True, index=True) # SHA-256 of the uploaded file
     mindmap = Column(Text, nullable=True)
     key_points_summary = Column(Text, nullable=True)
     quick_quiz = Column(Text, nullable=True)
@@ -98,6 +99,18 @@ class DatabaseManager:
 
     def init_database(self):
         Base.metadata.create_all(bind=self.engine)
+        self._add_content_hash_column()
+
+    def _add_content_hash_column(self):
+        """create_all 不會修改既有資料表，舊資料庫在這裡補上 documents.content_hash 欄位與索引"""
+        inspector = inspect(self.engine)
+        if not inspector.has_table('documents'):
+            return
+        if 'content_hash' in {col['name'] for col in inspector.get_columns('documents')}:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE documents ADD COLUMN content_hash VARCHAR(64)"))
+            conn.execute(text("CREATE INDEX ix_documents_content_hash ON documents (content_hash)"))
 
     @contextmanager
     def _session_scope(self):
@@ -193,6 +206,15 @@ class DatabaseManager:
                 return None
             return {c.name: getattr(doc, c.name) for c in doc.__table__.columns}
 
+    def get_document_by_content_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        if not content_hash:
+            return None
+        with self._session_scope() as session:
+            doc = session.query(Document).filter(Document.content_hash == content_hash).order_by(Document.id).first()
+            if not doc:
+                return None
+            return {c.name: getattr(doc, c.name) for c in doc.__table__.columns}
+
     def add_or_get_knowledge_point(self, name: str, subject: str, description: str = "") -> int:
         with self._session_scope() as session:
             kp = session.query(KnowledgePoint).filter_by(name=name).first()
@@ -218,6 +240,11 @@ class DatabaseManager:
         with self._session_scope() as session:
             session.query(Question).filter(Question.id == question_id).update({"mindmap_code": mindmap_code})
 
+    def update_document_content_hash(self, document_id: int, content_hash: str):
+        """處理完成後才寫入內容雜湊，未完成的文件不會被當成已處理過的重複內容"""
+        with self._session_scope() as session:
+            session.query(Document).filter(Document.id == document_id).update({"content_hash": content_hash})
+
     def update_document_summary_and_quiz(self, document_id: int, summary: str, quiz: str):
         with self._session_scope() as session:
             session.query(Document).filter(Document.id == document_id).update({
@@ -313,6 +340,27 @@ class DatabaseManager:
                     "created_at": q.created_at
                 } for q in questions
             ]
+
+    def count_questions_by_document_id(self, document_id: int) -> int:
+        with self._session_scope() as session:
+            return session.query(Question).filter(Question.document_id == document_id).count()
+
+    def get_questions_page_by_document_id(self, document_id: int, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
+        """依建立順序分頁取得文件的題目（含答案來源與知識點）"""
+        with self._session_scope() as session:
+            questions = session.query(Question).options(joinedload(Question.knowledge_points)).filter(
+                Question.document_id == document_id
+            ).order_by(Question.created_at, Question.id).offset(offset).limit(limit).all()
+            return [
+                {
+                    "id": q.id, "subject": q.subject, "title": q.title,
+                    "question_text": q.question_text, "answer_text": q.answer_text,
+                    "answer_sources": q.answer_sources,
+                    "difficulty": q.difficulty, "guidance_level": q.guidance_level,
+                    "created_at": q.created_at,
+                    "knowledge_points": [kp.name for kp in q.knowledge_points]
+                } for q in questions
+            ]
     
     def get_all_knowledge_points(self) -> List[Dict[str, Any]]:
         with self._session_scope() as session:
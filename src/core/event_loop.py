@@ -0,0 +1,90 @@
+"""
+共用的背景事件迴圈
+所有同步程式碼（Flask 路由、非同步工作線程）透過 run_coroutine_sync 把協程交給同一個長駐迴圈執行，
+不再每次請求都建立、關閉新的事件迴圈與線程
+"""
+import asyncio
+import atexit
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Optional
+
+
+class BackgroundEventLoop:
+    """在獨立 daemon 線程中執行的長駐 asyncio 事件迴圈"""
+
+    def __init__(self, name: str = "background-event-loop"):
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """啟動迴圈線程（重複呼叫不會建立第二個迴圈）"""
+        with self._lock:
+            if self.is_running:
+                return
+            self._started.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        self._started.wait()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    def submit(self, coro: Awaitable[Any]):
+        """執行緒安全地提交協程，回傳 concurrent.futures.Future"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[Any], timeout: float = None) -> Any:
+        """提交協程並阻塞等待結果；逾時會取消協程並拋出 TimeoutError"""
+        if self.is_running and threading.current_thread() is self._thread:
+            raise RuntimeError("不可在背景事件迴圈線程內同步等待協程，請直接 await")
+
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"協程執行超過 {timeout} 秒")
+
+    def stop(self):
+        """停止迴圈並等待線程結束"""
+        with self._lock:
+            if not self.is_running:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            thread = self._thread
+        thread.join(timeout=10)
+
+
+_background_loop = BackgroundEventLoop()
+atexit.register(_background_loop.stop)
+
+
+def get_background_loop() -> BackgroundEventLoop:
+    """取得全域共用的背景事件迴圈（尚未啟動時會在第一次提交時啟動）"""
+    return _background_loop
+
+
+def run_coroutine_sync(coro: Awaitable[Any], timeout: float = None) -> Any:
+    """在共用背景迴圈中執行協程並回傳結果，供同步程式碼呼叫"""
+    return _background_loop.run(coro, timeout=timeout)
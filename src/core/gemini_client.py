@@ -116,6 +116,7 @@ class GeminiClient:
 
         *   **準則 C：格式化規則**
             *   **程式碼格式化**：信任輸入的縮排，只需用 ```pseudocode ... ``` 包裹程式碼區塊。**絕對不要**修改縮排。
+            *   **表格格式化**：輸入中的 Markdown 表格（`| 欄位 | 欄位 |`）是由原始 PDF 表格還原而來（例如關聯綱要），請原樣保留在 `stem` 中，**不要**攤平成文字。
             *   **語意格式化 (處理底線等)**：
                 1.  **掃描關鍵句**：在文本中尋找描述格式意義的句子，例如「**加底線的屬性為該表格之主鍵**」。
                 2.  **理解規則**：理解這句話的含義（底線 = 主鍵）。
@@ -2,11 +2,13 @@
 處理單一問題的流程
 """
 import asyncio
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, List, Optional
 from ..core.gemini_client import GeminiClient
 from ..core.database import DatabaseManager
+from ..core.event_loop import run_coroutine_sync
 from ..utils.file_processor import FileProcessor
-from ..utils.markdown_utils import format_code_blocks, format_answer_text
+from ..utils.markdown_utils import format_code_blocks, format_answer_text, sanitize_question_text
+from .content_flow import ProcessingCancelled
 
 class AnswerFlow:
     """
@@ -18,30 +20,10 @@ class AnswerFlow:
         self.file_processor = FileProcessor()
 
     @staticmethod
-    def _sanitize_question_text(text: str) -> str:
-        """移除可能的答案標題，並保留程式碼區塊與縮排"""
-        if not text:
-            return text
-
-        import re
-        from ..utils.markdown_utils import detect_and_fence_indented_code
-
-        pattern = re.compile(r"^\s*(答案|解答|參考答案|建議|說明|解析)[\s:：]", re.I)
-        lines = text.splitlines()
-        sanitized_lines = []
-        in_code_block = False
-
-        for line in lines:
-            if line.strip().startswith("```"):
-                in_code_block = not in_code_block
-                sanitized_lines.append(line)
-            elif in_code_block:
-                sanitized_lines.append(line)
-            elif not pattern.match(line):
-                sanitized_lines.append(line)
-
-        cleaned = "\n".join(sanitized_lines).strip()
-        return detect_and_fence_indented_code(cleaned)
+    def _check_cancelled(cancel_check: Optional[Callable[[], bool]]) -> None:
+        """呼叫端要求取消時拋出 ProcessingCancelled"""
+        if cancel_check is not None and cancel_check():
+            raise ProcessingCancelled("處理已被取消")
 
     def process_file(self, file_path: str, filename: str, subject: str) -> Dict[str, Any]:
         """處理檔案的同步包裝方法"""
@@ -50,15 +32,9 @@ class AnswerFlow:
             content, file_type = self.file_processor.process_input(file_path)
             
             # 將檔案內容當作問題處理
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                result = loop.run_until_complete(
-                    self.process_question(content, subject, {'source': filename})
-                )
-                return result
-            finally:
-                loop.close()
+            return run_coroutine_sync(
+                self.process_question(content, subject, {'source': filename})
+            )
                 
         except Exception as e:
             return {
@@ -67,24 +43,40 @@ class AnswerFlow:
                 'questions': []
             }
 
-    async def process_question(self, question_text: str, subject: str, additional_info: Dict = None) -> Dict[str, Any]:
+    def process_question_content(self, question_content: str, filename: str, subject: str = None,
+                                 cancel_check: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+        """
+        非同步工作（question_processing）使用的同步入口。
+        cancel_check 回傳 True 時會在下一個階段前拋出 ProcessingCancelled。
+        """
+        return run_coroutine_sync(
+            self.process_question(question_content, subject or '其他', {'source': filename}, cancel_check)
+        )
+
+    async def process_question(self, question_text: str, subject: str, additional_info: Dict = None,
+                               cancel_check: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
         """
         處理單一問題的完整流程
+
+        cancel_check 為可選的回呼函式，在生成答案、提取知識點、儲存與生成心智圖之前檢查；
+        儲存後才被取消時會移除剛寫入的問題，不留在題庫中。
         """
         if additional_info is None:
             additional_info = {}
             
         try:
             # 先清理題目內容可能包含的答案
-            question_text = self._sanitize_question_text(question_text)
+            question_text = sanitize_question_text(question_text)
 
             # 1. 生成答案
+            self._check_cancelled(cancel_check)
             print("正在生成答案...")
             answer_data = await self.gemini.generate_answer(question_text)
             if not answer_data or 'answer' not in answer_data:
                 raise ValueError("無法生成有效的答案")
 
             # 2. 提取知識點
+            self._check_cancelled(cancel_check)
             print(f"正在從問題中提取 '{subject}' 科的知識點...")
             combined_text = f"題目：{question_text}\n答案：{answer_data['answer']}"
             knowledge_points = await self.gemini.extract_knowledge_points(combined_text, subject)
@@ -94,8 +86,11 @@ class AnswerFlow:
                 knowledge_points = []
 
             # 3. 儲存資料
+            self._check_cancelled(cancel_check)
             print("正在儲存問題和答案...")
-            result = self._store_question_data(
+            # 同步的資料庫寫入在執行緒中進行，不卡住共用的事件迴圈
+            result = await asyncio.to_thread(
+                self._store_question_data,
                 question_text=question_text,
                 answer_text=answer_data['answer'],
                 answer_sources=answer_data.get('sources', []),
@@ -105,18 +100,26 @@ class AnswerFlow:
 
             # 為問題生成心智圖
             mindmap_code = None
-            if knowledge_points:
-                try:
-                    mindmap_code = await self.gemini.generate_mindmap(subject, knowledge_points)
-                    if mindmap_code:
-                        self.db.update_question_mindmap(result['question_id'], mindmap_code)
-                except Exception as e:
-                    print(f"生成心智圖失敗: {e}")
+            try:
+                if knowledge_points:
+                    self._check_cancelled(cancel_check)
+                    try:
+                        mindmap_code = await self.gemini.generate_mindmap(subject, knowledge_points)
+                        if mindmap_code:
+                            await asyncio.to_thread(self.db.update_question_mindmap, result['question_id'], mindmap_code)
+                    except Exception as e:
+                        print(f"生成心智圖失敗: {e}")
+                self._check_cancelled(cancel_check)
+            except ProcessingCancelled:
+                print(f"🛑 處理已取消，移除已儲存的問題文件 {result['document_id']}")
+                await asyncio.to_thread(self.db.delete_document, result['document_id'])
+                raise
 
             return {
                 'success': True,
                 'type': 'question',
                 'question_id': result['question_id'],
+                'document_id': result['document_id'],
                 'data': {
                     'answer': answer_data['answer'],
                     'sources': answer_data.get('sources', []),
@@ -125,6 +128,8 @@ class AnswerFlow:
                 }
             }
 
+        except ProcessingCancelled:
+            raise
         except Exception as e:
             return {
                 'success': False,
@@ -163,4 +168,4 @@ class AnswerFlow:
             kp_id = self.db.add_or_get_knowledge_point(name=kp_name, subject=subject)
             self.db.link_question_to_knowledge_point(question_id, kp_id)
 
-        return {'question_id': question_id}
+        return {'question_id': question_id, 'document_id': doc_id}
@@ -1,17 +1,22 @@
-from typing import Dict, Any
-import asyncio
-import concurrent.futures
+from typing import Dict, Any, Callable, List, Optional
 from src.core.gemini_client import GeminiClient
 from src.core.database import DatabaseManager
+from src.core.event_loop import run_coroutine_sync
 import json
+import asyncio
 from ..utils.markdown_utils import (
     format_code_blocks,
     format_summary_to_markdown,
     format_answer_text,
-    detect_and_fence_indented_code,
+    sanitize_question_text,
 )
 from ..flows.mindmap_flow import MindmapFlow
 
+
+class ProcessingCancelled(Exception):
+    """處理流程被使用者取消或超過時限時拋出，用於中斷後續的 AI 呼叫"""
+
+
 class ContentFlow:
     """內容處理流程管理器 - 統一管理所有內容分析、問題生成和知識點關聯"""
     
@@ -23,33 +28,45 @@ class ContentFlow:
         self.mindmap_flow = MindmapFlow(gemini_client, db_manager)
 
     @staticmethod
-    def _sanitize_question_text(text: str) -> str:
-        """移除可能包含解答或說明標題的行，但保留程式碼區塊內的內容"""
-        if not text:
-            return text
-        import re
-        pattern = re.compile(r"^\s*(答案|解答|參考答案|建議|說明|解析)[\s:：]", re.I)
-        lines = text.splitlines()
-        sanitized_lines = []
-        in_code_block = False
+    def _check_cancelled(cancel_check: Optional[Callable[[], bool]]) -> None:
+        """在各處理階段之間檢查是否已被要求停止"""
+        if cancel_check is not None and cancel_check():
+            raise ProcessingCancelled("處理已被取消")
+    
+    def _link_knowledge_points(self, question_id: str, names: List[str], subject: str) -> List[str]:
+        """建立題目與知識點的關聯，回傳整理後的知識點名稱（同步資料庫操作，以 asyncio.to_thread 呼叫）"""
+        linked = []
+        for kp_name in names:
+            kp_id = self.db.add_or_get_knowledge_point(kp_name.strip(), subject)
+            self.db.link_question_to_knowledge_point(question_id, kp_id)
+            linked.append(kp_name.strip())
+        return linked
 
-        for line in lines:
-            if line.strip().startswith("```"):
-                in_code_block = not in_code_block
-                sanitized_lines.append(line)
-            elif in_code_block:
-                sanitized_lines.append(line)
-            elif not pattern.match(line):
-                sanitized_lines.append(line)
+    def find_duplicate_result(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """若已有相同內容雜湊的文件，直接回傳既有文件與題目，不再呼叫 AI"""
+        document = self.db.get_document_by_content_hash(content_hash)
+        if not document:
+            return None
 
-        cleaned = "\n".join(sanitized_lines).strip()
-        return detect_and_fence_indented_code(cleaned)
+        questions = self.db.get_questions_by_document_id(document['id'])
+        return {
+            'success': True,
+            'duplicate': True,
+            'subject': document.get('subject'),
+            'document_id': document['id'],
+            'questions': questions,
+            'message': f'此檔案先前已處理過，沿用既有結果（{len(questions)} 道題目）。'
+        }
 
-    
-    
-    def process_file(self, file_path: str, filename: str, suggested_subject: str = None) -> Dict[str, Any]:
+    def process_file(self, file_path: str, filename: str, suggested_subject: str = None,
+                     content_hash: str = None) -> Dict[str, Any]:
         """處理檔案的統一入口點"""
         try:
+            content_hash = content_hash or self.file_processor.compute_content_hash(file_path)
+            duplicate = self.find_duplicate_result(content_hash)
+            if duplicate:
+                return duplicate
+
             # content is the extracted text from the file
             content, _ = self.file_processor.process_input(file_path)
 
@@ -63,17 +80,25 @@ class ContentFlow:
             # ======================================================================
 
             # Pass the file_path along with the extracted content
-            return self.complete_ai_processing(content, filename, suggested_subject, file_path=file_path)
+            return self.complete_ai_processing(content, filename, suggested_subject, file_path=file_path, content_hash=content_hash)
         except Exception as e:
             print(f"處理檔案時發生錯誤: {e}")
             return {'success': False, 'error': str(e), 'message': f'檔案處理失敗: {str(e)}'}
     
-    def complete_ai_processing(self, content: str, filename: str, suggested_subject: str = None, source_url: str = None, file_path: str = None) -> Dict[str, Any]:
-        """完整 AI 處理流程"""
+    def complete_ai_processing(self, content: str, filename: str, suggested_subject: str = None, source_url: str = None, file_path: str = None,
+                               cancel_check: Optional[Callable[[], bool]] = None, content_hash: str = None) -> Dict[str, Any]:
+        """
+        完整 AI 處理流程
+
+        cancel_check 為可選的回呼函式，回傳 True 時會在下一個階段或下一道題目前
+        拋出 ProcessingCancelled，讓呼叫端（如 AsyncProcessor）可以中止處理。
+        """
         try:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(asyncio.run, self._run_async_processing(content, filename, suggested_subject, source_url, file_path))
-                return future.result()
+            return run_coroutine_sync(
+                self._run_async_processing(content, filename, suggested_subject, source_url, file_path, cancel_check, content_hash)
+            )
+        except ProcessingCancelled:
+            raise
         except Exception as e:
             print(f"完整 AI 處理時發生錯誤: {e}")
             return {'success': False, 'error': str(e), 'message': '處理失敗，請稍後再試'}
@@ -96,9 +121,11 @@ class ContentFlow:
                 return "（參考答案生成失敗或未提供，請檢查原始資料或稍後重試。）"
             return extracted_answer
 
-    async def _run_async_processing(self, content: str, filename: str, suggested_subject: str = None, source_url: str = None, file_path: str = None) -> Dict[str, Any]:
+    async def _run_async_processing(self, content: str, filename: str, suggested_subject: str = None, source_url: str = None, file_path: str = None,
+                                    cancel_check: Optional[Callable[[], bool]] = None, content_hash: str = None) -> Dict[str, Any]:
         """執行異步處理流程"""
         try:
+            self._check_cancelled(cancel_check)
             print("🤖 AI 正在分析內容類型...")
             parsed_data = await self.gemini.parse_exam_paper(content)
 
@@ -121,8 +148,11 @@ class ContentFlow:
             detected_subject = parsed_data.get('subject', suggested_subject or '其他')
             
             print(f"📋 內容分類結果：{content_type} ({detected_subject})")
+            self._check_cancelled(cancel_check)
             
-            doc_id = self.db.add_document(
+            # 所有流程共用同一個事件迴圈，同步的資料庫操作改在執行緒中進行，避免卡住其他工作與網頁爬取
+            doc_id = await asyncio.to_thread(
+                self.db.add_document,
                 title=filename, 
                 content=content, # Extracted text
                 subject=detected_subject, 
@@ -130,23 +160,32 @@ class ContentFlow:
                 file_path=file_path # The actual file path
             )
             
-            if content_type == 'exam_paper':
-                print("📝 檢測到考題內容，執行考題處理流程...")
-                result = await self._process_exam_content(content, detected_subject, doc_id, parsed_data)
-            else:
-                print("📚 檢測到學習資料，執行學習資料處理流程...")
-                result = await self._process_study_material(content, detected_subject, doc_id, parsed_data)
+            try:
+                if content_type == 'exam_paper':
+                    print("📝 檢測到考題內容，執行考題處理流程...")
+                    result = await self._process_exam_content(content, detected_subject, doc_id, parsed_data, cancel_check)
+                else:
+                    print("📚 檢測到學習資料，執行學習資料處理流程...")
+                    result = await self._process_study_material(content, detected_subject, doc_id, parsed_data, cancel_check)
+                if result.get('success') and content_hash:
+                    # 題目、摘要與測驗都已寫入後才記錄雜湊，失敗的文件可以重新上傳處理；
+                    # 記錄前最後確認一次取消，已取消的工作不會留下可供去重的文件
+                    self._check_cancelled(cancel_check)
+                    await asyncio.to_thread(self.db.update_document_content_hash, doc_id, content_hash)
+            except ProcessingCancelled:
+                # 取消或逾時：移除只處理了一部分的文件與題目，不留在題庫中
+                print(f"🛑 處理已取消，移除未完成的文件 {doc_id}")
+                await asyncio.to_thread(self.db.delete_document, doc_id)
+                raise
             
-            if result.get('success'):
-                return result
-            else:
-                return result
+            return result
                 
         except Exception as e:
             print(f"異步處理時發生錯誤: {e}")
             raise e
     
-    async def _process_exam_content(self, content: str, subject: str, doc_id: int, parsed_data: Dict) -> Dict[str, Any]:
+    async def _process_exam_content(self, content: str, subject: str, doc_id: int, parsed_data: Dict,
+                                    cancel_check: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
         """考題處理流程"""
         questions = parsed_data.get('questions', [])
         saved_questions = []
@@ -155,10 +194,11 @@ class ContentFlow:
         print(f"📝 開始處理 {len(questions)} 道考題...")
         
         for i, question_data in enumerate(questions, 1):
+            self._check_cancelled(cancel_check)
             try:
                 # ======================================================================
                 # ▼▼▼ 這是解決排版問題的最終修正！ ▼▼▼
-                # 我們不再呼叫 _sanitize_question_text，因為 stem 的格式已經是完美的了。
+                # 我們不再呼叫 sanitize_question_text，因為 stem 的格式已經是完美的了。
                 question_text = question_data.get('stem', '')
                 # ▲▲▲ 這是解決排版問題的最終修正！ ▲▲▲
                 # ======================================================================
@@ -182,7 +222,8 @@ class ContentFlow:
                 print(f"DEBUG: answer_text type: {type(answer_text)}, value: {answer_text}")
                 sources_json = json.dumps(answer_data.get('sources', []), ensure_ascii=False)
                 
-                question_id = self.db.insert_question(
+                question_id = await asyncio.to_thread(
+                    self.db.insert_question,
                     document_id=doc_id,
                     title=question_data.get('title', f'題目 {i}'),
                     question_text=format_code_blocks(question_text),
@@ -197,10 +238,9 @@ class ContentFlow:
                 await self.mindmap_flow.generate_and_save_mindmap(question_id)
                 
                 knowledge_points = question_data.get('knowledge_points', [])
-                for kp_name in knowledge_points:
-                    kp_id = self.db.add_or_get_knowledge_point(kp_name.strip(), subject)
-                    self.db.link_question_to_knowledge_point(question_id, kp_id)
-                    all_knowledge_points.add(kp_name.strip())
+                all_knowledge_points.update(
+                    await asyncio.to_thread(self._link_knowledge_points, question_id, knowledge_points, subject)
+                )
                 
                 saved_questions.append({
                     'id': question_id,
@@ -223,7 +263,8 @@ class ContentFlow:
             'message': f'成功處理考題，解析了 {len(saved_questions)} 道題目。'
         }
 
-    async def _process_study_material(self, content: str, subject: str, doc_id: int, parsed_data: Dict) -> Dict[str, Any]:
+    async def _process_study_material(self, content: str, subject: str, doc_id: int, parsed_data: Dict,
+                                      cancel_check: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
         """學習資料處理流程"""
         print("📚 執行學習資料處理流程...")
         
@@ -233,14 +274,16 @@ class ContentFlow:
         all_knowledge_points = set()
 
         for q_data in generated_questions:
-            q_text = self._sanitize_question_text(q_data.get('question', ''))
+            self._check_cancelled(cancel_check)
+            q_text = sanitize_question_text(q_data.get('question', ''))
             answer_data = await self.gemini.generate_answer(q_text)
             answer_text = format_code_blocks(
                 format_answer_text(self._extract_answer_string(answer_data))
             )
             sources_json = json.dumps(answer_data.get('sources', []), ensure_ascii=False)
 
-            question_id = self.db.insert_question(
+            question_id = await asyncio.to_thread(
+                self.db.insert_question,
                 document_id=doc_id,
                 title=q_data.get('title', '模擬題'),
                 question_text=format_code_blocks(q_text),
@@ -254,7 +297,7 @@ class ContentFlow:
             
             # 將心智圖程式碼儲存到 mindmap_code 欄位
             if mindmap_code:
-                self.db.update_question_mindmap(question_id, mindmap_code)
+                await asyncio.to_thread(self.db.update_question_mindmap, question_id, mindmap_code)
 
             q_data['answer'] = answer_text
             q_data['sources'] = answer_data.get('sources', [])
@@ -265,12 +308,12 @@ class ContentFlow:
 
             
 
-            for kp_name in q_data.get('knowledge_points', []):
-                kp_id = self.db.add_or_get_knowledge_point(kp_name.strip(), subject)
-                self.db.link_question_to_knowledge_point(question_id, kp_id)
-                all_knowledge_points.add(kp_name.strip())
+            all_knowledge_points.update(
+                await asyncio.to_thread(self._link_knowledge_points, question_id, q_data.get('knowledge_points', []), subject)
+            )
 
         # 生成摘要和測驗
+        self._check_cancelled(cancel_check)
         summary_raw_data = await self.gemini.generate_summary(content)
         # 確保 summary_data 是字典，如果不是則嘗試解析
         if isinstance(summary_raw_data, str):
@@ -281,12 +324,13 @@ class ContentFlow:
         else:
             summary_data = summary_raw_data
 
+        self._check_cancelled(cancel_check)
         quiz_data = await self.gemini.generate_quick_quiz(content, subject)
 
         # 儲存摘要和測驗
         summary_text = format_summary_to_markdown(summary_data) if summary_data else None
         quiz_text = json.dumps(quiz_data, ensure_ascii=False) if quiz_data else None
-        self.db.update_document_summary_and_quiz(doc_id, summary_text, quiz_text)
+        await asyncio.to_thread(self.db.update_document_summary_and_quiz, doc_id, summary_text, quiz_text)
 
         return {
             'success': True,
@@ -20,20 +20,13 @@ class MindmapFlow:
             # 使用檔案處理器讀取檔案內容
             content, file_type = self.file_processor.process_input(file_path)
             
-            # 將檔案內容生成心智圖
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                # 這裡我們需要先將內容儲存為問題，然後生成心智圖
-                # 為了簡化，我們可以返回一個基本的結果
-                result = {
-                    'success': True,
-                    'message': f'已處理檔案 {filename}，請選擇特定問題來生成心智圖',
-                    'questions': []
-                }
-                return result
-            finally:
-                loop.close()
+            # 這裡我們需要先將內容儲存為問題，然後生成心智圖
+            # 為了簡化，我們可以返回一個基本的結果（不需要事件迴圈）
+            return {
+                'success': True,
+                'message': f'已處理檔案 {filename}，請選擇特定問題來生成心智圖',
+                'questions': []
+            }
                 
         except Exception as e:
             return {
@@ -46,7 +39,7 @@ class MindmapFlow:
         """為指定問題生成心智圖並儲存"""
         try:
             # 1. 從資料庫取得問題內容
-            question_data = self.db.get_question_by_id(question_id)
+            question_data = await asyncio.to_thread(self.db.get_question_by_id, question_id)
             if not question_data:
                 return {'success': False, 'error': '找不到指定的問題'}
 
@@ -78,7 +71,7 @@ class MindmapFlow:
 
             # 4. 將心智圖程式碼儲存回資料庫
             print("正在儲存心智圖...")
-            self.db.update_question_mindmap(question_id, mindmap_code)
+            await asyncio.to_thread(self.db.update_question_mindmap, question_id, mindmap_code)
 
             return mindmap_code
 
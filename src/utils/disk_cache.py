@@ -0,0 +1,69 @@
+"""
+本機磁碟快取的容量管理
+OCR 結果與網址抓取快取都以檔案存在工作目錄下；這裡以檔案修改時間作為最近使用時間
+（讀取命中時會更新），超過保存天數或總容量上限時從最久未使用的檔案開始刪除
+"""
+import os
+import time
+import threading
+from typing import Dict
+
+# 同一個快取目錄兩次清理之間至少間隔的秒數，避免每次寫入都掃描整個目錄
+PRUNE_INTERVAL_SECONDS = 60
+# 寫入中的暫存檔超過此秒數仍存在，視為中斷後遺留的檔案
+STALE_TEMP_SECONDS = 3600
+
+_last_pruned: Dict[str, float] = {}
+_prune_lock = threading.Lock()
+
+
+def touch(path: str):
+    """快取命中時更新檔案的修改時間，讓清理時保留最近使用的項目"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def prune_cache_dir(cache_dir: str, max_bytes: int, max_age_seconds: float, force: bool = False) -> int:
+    """
+    刪除超過保存期限的快取檔案；總容量仍超過 max_bytes 時，再從最久未使用的檔案開始刪除。
+    每個目錄每 PRUNE_INTERVAL_SECONDS 秒最多清理一次（force=True 時立即清理）。
+
+    Returns:
+        刪除的檔案數
+    """
+    now = time.time()
+    with _prune_lock:
+        if not force and now - _last_pruned.get(cache_dir, 0) < PRUNE_INTERVAL_SECONDS:
+            return 0
+        _last_pruned[cache_dir] = now
+
+    entries = []
+    total_bytes = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith('.tmp') and now - stat.st_mtime < STALE_TEMP_SECONDS:
+                continue  # 其他執行緒正在寫入
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_bytes += stat.st_size
+
+    removed = 0
+    for mtime, size, path in sorted(entries):
+        if now - mtime <= max_age_seconds and total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed += 1
+        total_bytes -= size
+
+    if removed:
+        print(f"清理快取目錄 {cache_dir}：刪除 {removed} 個檔案")
+    return removed
@@ -1,51 +1,243 @@
+import io
+import asyncio
 import os
-import requests
-from typing import Tuple
-from charset_normalizer import from_path
-import tempfile
-
-# Google Cloud Vision OCR
-try:
-    from google.cloud import vision
-    from google.oauth2 import service_account
-except ImportError:
-    vision = None
-    service_account = None
-
-# PDF 轉圖片
-try:
-    from pdf2image import convert_from_path
-except ImportError:
-    convert_from_path = None
-
-# 文件處理相關
-try:
-    import pdfplumber
-except ImportError:
-    pdfplumber = None
-
-try:
-    from docx import Document
-except ImportError:
-    Document = None
-
-try:
-    from bs4 import BeautifulSoup  
-except ImportError:
-    BeautifulSoup = None
+import json
+import hashlib
+import importlib
+import importlib.util
+import mimetypes
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+from . import disk_cache
+from .process_pool import get_extraction_pool_size, run_in_extraction_pool, submit_to_extraction_pool
+
+
+def _import_optional(module_name: str, package_name: str):
+    """
+    第一次用到時才匯入較重的選用套件（google-cloud-vision、pdfplumber、pdf2image 等），
+    讓只提供頁面的行程不必在啟動時載入它們。未安裝時拋出附安裝指令的 ImportError。
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise ImportError(f"請安裝 {package_name} 套件：pip install {package_name}")
+
+
+# 抽取器註冊表：副檔名 / MIME 類型 → (輸入類型, 抽取函式)
+_EXTRACTORS_BY_EXTENSION: Dict[str, Tuple[str, Callable]] = {}
+_EXTRACTORS_BY_MIME_TYPE: Dict[str, Tuple[str, Callable]] = {}
+
+
+def register_extractor(input_type: str, extensions: Iterable[str] = (), mime_types: Iterable[str] = ()):
+    """
+    註冊檔案抽取器的裝飾器，新增格式（pptx、epub…）不需修改 process_input。
+    抽取函式簽名為 func(processor: FileProcessor, file_path: str) -> str，
+    所需的第三方套件請在函式內以 _import_optional 匯入。
+    """
+    def decorator(func: Callable):
+        for extension in extensions:
+            _EXTRACTORS_BY_EXTENSION[extension.lower()] = (input_type, func)
+        for mime_type in mime_types:
+            _EXTRACTORS_BY_MIME_TYPE[mime_type.lower()] = (input_type, func)
+        return func
+    return decorator
+
+
+def get_extractor(file_path: str) -> Optional[Tuple[str, Callable]]:
+    """依副檔名（其次依猜測的 MIME 類型）找出抽取器，找不到時回傳 None"""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in _EXTRACTORS_BY_EXTENSION:
+        return _EXTRACTORS_BY_EXTENSION[extension]
+    mime_type, _ = mimetypes.guess_type(file_path)
+    if mime_type:
+        return _EXTRACTORS_BY_MIME_TYPE.get(mime_type.lower())
+    return None
+
+
+# 編碼偵測只取檔案開頭的樣本，避免對整份大型檔案執行 charset_normalizer
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+# 依長度由長到短排列，避免 UTF-32 LE 的 BOM 被誤判為 UTF-16 LE
+_TEXT_BOMS = (
+    (b'\xef\xbb\xbf', 'utf-8'),
+    (b'\xff\xfe\x00\x00', 'utf-32-le'),
+    (b'\x00\x00\xfe\xff', 'utf-32-be'),
+    (b'\xff\xfe', 'utf-16-le'),
+    (b'\xfe\xff', 'utf-16-be'),
+)
+
+# 含有點陣圖且文字少於此字數的頁面視為掃描頁，改走 OCR（沒有圖片的空白頁或分隔頁不送 OCR）
+PDF_PAGE_MIN_TEXT_CHARS = 20
+# 整份 PDF 擷取的文字少於此字數時，整份回退到 OCR（read_pdf_file 與 iter_input_chunks 共用）
+PDF_DOC_MIN_TEXT_CHARS = 50
+
+# 靜態 HTML 擷取時移除的元素（導覽列、頁尾、廣告等）
+STATIC_UNWANTED_SELECTORS = (
+    'script', 'style', 'noscript', 'template', 'nav', 'footer', 'header', 'aside',
+    '.advertisement', '.ads', '.ad', '.sidebar', '.footer', '.header-ads',
+    '.popup', '.modal', '.cookie-notice',
+)
+# 主要內容依序嘗試的容器，與 Playwright 擷取相同
+STATIC_TEXT_SELECTORS = ('main', 'article', '.content', '.main-content', '#content')
+# 出現在 <noscript> 中、表示頁面需要 JavaScript 才能顯示內容的字句
+JS_REQUIRED_MARKERS = (
+    'enable javascript', 'javascript is required', 'javascript is disabled',
+    'requires javascript', '啟用 javascript', '啟用javascript', '開啟 javascript',
+)
+# 前端框架常見的掛載點；伺服器回傳的這些節點若是空的，內容要等 JavaScript 渲染
+SPA_ROOT_IDS = ('root', 'app', '__next', '__nuxt')
+
+_html_parser: Optional[str] = None
+
+
+def _get_html_parser() -> str:
+    """有安裝 lxml 時使用較快的 lxml 解析器，否則使用內建的 html.parser"""
+    global _html_parser
+    if _html_parser is None:
+        _html_parser = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+    return _html_parser
+
+
+def _table_to_markdown(rows: List[List[Optional[str]]]) -> str:
+    """
+    將 pdfplumber 取出的表格列轉成精簡的 Markdown 表格；不足 2 欄時回傳空字串。
+    只有一列的表格（例如以一排屬性方框畫出的關聯綱要）輸出為只有表頭的 Markdown 表格
+    """
+    cleaned = [[' '.join((cell or '').split()).replace('|', '\\|') for cell in row] for row in rows]
+    cleaned = [row for row in cleaned if any(row)]
+    if not cleaned:
+        return ""
+
+    width = max(len(row) for row in cleaned)
+    cleaned = [row + [''] * (width - len(row)) for row in cleaned]
+    # 移除整欄皆空的欄位（合併儲存格常造成空欄）
+    keep_columns = [i for i in range(width) if any(row[i] for row in cleaned)]
+    cleaned = [[row[i] for i in keep_columns] for row in cleaned]
+    if len(keep_columns) < 2:
+        return ""
+
+    lines = ['| ' + ' | '.join(cleaned[0]) + ' |', '|' + '---|' * len(keep_columns)]
+    lines.extend('| ' + ' | '.join(row) + ' |' for row in cleaned[1:])
+    return "\n".join(lines)
+
+
+def _extract_page_text_with_tables(page) -> str:
+    """
+    重建單頁文字，並將偵測到的表格（例如關聯綱要）輸出為 Markdown 表格，
+    表格範圍內的詞彙不再攤平成以空白分隔的文字行，表格依垂直位置插回原處。
+    """
+    words = page.extract_words(use_text_flow=True, x_tolerance=2)
+    # 預設的 lines 策略需要框線；頁面沒有任何線段時跳過表格偵測
+    tables = page.find_tables() if page.edges else []
+    blocks = []
+    for table in tables:
+        markdown = _table_to_markdown(table.extract())
+        if markdown:
+            blocks.append((table.bbox, markdown))
+    if not blocks:
+        return FileProcessor._reconstruct_text_from_words(words)
+
+    blocks.sort(key=lambda block: block[0][1])
+    # segments[i] 收集位於第 i 個表格之前的詞彙，最後一段為所有表格之後的詞彙
+    segments = [[] for _ in range(len(blocks) + 1)]
+    for word in words:
+        center_x = (word['x0'] + word['x1']) / 2
+        center_y = (word['top'] + word['bottom']) / 2
+        if any(x0 <= center_x <= x1 and top <= center_y <= bottom
+               for (x0, top, x1, bottom), _ in blocks):
+            continue
+        index = 0
+        while index < len(blocks) and word['top'] >= blocks[index][0][1]:
+            index += 1
+        segments[index].append(word)
+
+    parts = []
+    for index, segment in enumerate(segments):
+        text = FileProcessor._reconstruct_text_from_words(segment)
+        if text.strip():
+            parts.append(text)
+        if index < len(blocks):
+            parts.append(blocks[index][1])
+    return "\n\n".join(parts)
+
+
+def _extract_pdf_pages_text(file_path: str, page_numbers: List[int]) -> List[Tuple[int, str, bool]]:
+    """
+    [行程池工作] 以 pdfplumber 逐頁取出詞彙座標並重建排版文字，表格輸出為 Markdown（頁碼從 1 起算）。
+    回傳 (頁碼, 文字, 是否含有點陣圖)，供呼叫端判斷是否為需要 OCR 的掃描頁
+    """
+    pdfplumber = _import_optional('pdfplumber', 'pdfplumber')
+    results = []
+    with pdfplumber.open(file_path) as pdf:
+        for page_number in page_numbers:
+            page = pdf.pages[page_number - 1]
+            try:
+                text = _extract_page_text_with_tables(page)
+            except Exception as e:
+                print(f"第 {page_number} 頁表格偵測失敗: {e}，改用純文字重建。")
+                words = page.extract_words(use_text_flow=True, x_tolerance=2)
+                text = FileProcessor._reconstruct_text_from_words(words)
+            results.append((page_number, text, bool(page.images)))
+            page.flush_cache()
+    return results
+
+
+# 已擷取檔案文字的快取：絕對路徑 → ((修改時間, 檔案大小), 文字)
+EXTRACTED_TEXT_CACHE_ENTRIES = 32
+_extracted_text_cache: "OrderedDict[str, Tuple[Tuple[int, int], str]]" = OrderedDict()
+_extracted_text_lock = threading.Lock()
+
+
+def _rasterize_pdf_to_png(pdf_path: str, dpi: int, page_numbers: List[int]) -> List[bytes]:
+    """[行程池工作] 將 PDF 指定頁面逐頁點陣化並編碼成 PNG 位元組（頁碼從 1 起算）"""
+    convert_from_path = _import_optional('pdf2image', 'pdf2image').convert_from_path
+    png_pages = []
+    for page_number in page_numbers:
+        # 一次只轉一頁，轉成 PNG 後立即釋放 PIL 影像
+        for page in convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number):
+            buffer = io.BytesIO()
+            page.save(buffer, 'PNG')
+            png_pages.append(buffer.getvalue())
+            page.close()
+    return png_pages
 
 
 class GoogleVisionOCR:
     """Google Cloud Vision OCR 處理器"""
     
-    def __init__(self, credentials_path: str = "google_credentials.json"):
-        """初始化 Google Vision OCR 客戶端"""
+    def __init__(self, credentials_path: str = "google_credentials.json", max_concurrency: int = None):
+        """
+        初始化 Google Vision OCR 客戶端
+
+        Args:
+            credentials_path: 服務帳戶憑證檔案路徑
+            max_concurrency: 同時送往 Vision API 的頁數上限，預設讀取 OCR_MAX_CONCURRENCY（4）
+        """
         self.client = None
+        self._vision = None
         self.credentials_path = credentials_path
+        self.max_concurrency = max(1, max_concurrency or int(os.environ.get("OCR_MAX_CONCURRENCY", "4")))
+
+        # OCR 結果快取目錄（以圖片位元組的 SHA-256 為鍵），設為空字串可停用；
+        # 超過 OCR_CACHE_MAX_AGE_DAYS 天或 OCR_CACHE_MAX_MB 的部分會從最久未使用的開始刪除
+        cache_dir = os.environ.get("OCR_CACHE_DIR", "ocr_cache")
+        self.cache_dir = cache_dir or None
+        self.cache_max_bytes = int(float(os.environ.get("OCR_CACHE_MAX_MB", "500")) * 1024 * 1024)
+        self.cache_max_age = float(os.environ.get("OCR_CACHE_MAX_AGE_DAYS", "90")) * 86400
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
         
-        if vision is None:
+        try:
+            from google.cloud import vision
+            from google.oauth2 import service_account
+        except ImportError:
             print("警告：google-cloud-vision 未安裝，OCR 功能將不可用")
             return
+        self._vision = vision
         
         try:
             if os.path.exists(credentials_path):
@@ -59,14 +251,59 @@ class GoogleVisionOCR:
     
     def extract_text_from_image(self, image_path: str) -> str:
         """從圖片中提取文字，並返回帶有幾何座標的詞彙列表"""
+        with open(image_path, 'rb') as image_file:
+            content = image_file.read()
+        return self.extract_text_from_image_bytes(content)
+
+    def _cache_path(self, image_hash: str) -> str:
+        return os.path.join(self.cache_dir, image_hash[:2], f"{image_hash}.json")
+
+    def _load_cached_words(self, image_hash: str):
+        """讀取快取的詞彙座標列表；未命中或損毀時回傳 None"""
+        if not self.cache_dir:
+            return None
+        cache_path = self._cache_path(image_hash)
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                words = json.load(f)['words']
+        except (OSError, ValueError, KeyError):
+            return None
+        disk_cache.touch(cache_path)
+        return words
+
+    def _save_cached_words(self, image_hash: str, words: list):
+        """以暫存檔加替換的方式寫入快取，避免並行寫入產生半截檔案"""
+        if not self.cache_dir:
+            return
+        cache_path = self._cache_path(image_hash)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'words': words}, f, ensure_ascii=False)
+            os.replace(temp_path, cache_path)
+            disk_cache.prune_cache_dir(self.cache_dir, self.cache_max_bytes, self.cache_max_age)
+        except OSError as e:
+            print(f"寫入 OCR 快取失敗: {e}")
+
+    def extract_text_from_image_bytes(self, content: bytes) -> str:
+        """從圖片位元組中提取文字，並以幾何座標重建排版（相同圖片直接讀取本機快取）"""
+        image_hash = hashlib.sha256(content).hexdigest()
+        cached_words = self._load_cached_words(image_hash)
+        if cached_words is not None:
+            return FileProcessor._reconstruct_text_from_words(cached_words)
+
+        words_with_coords = self._detect_words(content)
+        self._save_cached_words(image_hash, words_with_coords)
+        return FileProcessor._reconstruct_text_from_words(list(words_with_coords))
+
+    def _detect_words(self, content: bytes) -> list:
+        """呼叫 Vision API，回傳帶有幾何座標的詞彙列表"""
         if self.client is None:
             raise ValueError("Google Vision OCR 客戶端未初始化")
 
         try:
-            with open(image_path, 'rb') as image_file:
-                content = image_file.read()
-
-            image = vision.Image(content=content)
+            image = self._vision.Image(content=content)
             response = self.client.document_text_detection(image=image)
 
             if response.error.message:
@@ -85,96 +322,160 @@ class GoogleVisionOCR:
                                     'x0': vertices[0].x,
                                     'top': vertices[0].y,
                                 })
-            return FileProcessor._reconstruct_text_from_words(words_with_coords)
+            return words_with_coords
 
         except Exception as e:
             raise ValueError(f"OCR 處理失敗: {e}")
     
-    def extract_text_from_pdf_pages(self, pdf_path: str) -> str:
-        """從 PDF 頁面中提取文字（通過轉換為圖片）"""
-        if convert_from_path is None:
-            raise ImportError("請安裝 pdf2image 套件：pip install pdf2image")
-        
-        if self.client is None:
-            raise ValueError("Google Vision OCR 客戶端未初始化")
-        
+    def extract_text_from_images(self, images: List[bytes]) -> List[str]:
+        """
+        並行 OCR 多張圖片，同時最多 max_concurrency 個請求在途，
+        回傳的文字順序與輸入的頁面順序一致
+        """
+        if len(images) <= 1 or self.max_concurrency == 1:
+            return [self.extract_text_from_image_bytes(image) for image in images]
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(images)),
+                                thread_name_prefix="vision-ocr") as executor:
+            return list(executor.map(self.extract_text_from_image_bytes, images))
+
+    def extract_text_by_page(self, pdf_path: str, page_numbers: List[int] = None) -> Dict[int, str]:
+        """
+        OCR 指定的 PDF 頁面（預設全部），回傳 {頁碼: 文字}。
+        以頁面視窗逐段點陣化（在抽取行程池中進行）並 OCR，
+        記憶體峰值只與視窗大小有關，與文件總頁數無關。
+        """
+        pdf2image = _import_optional('pdf2image', 'pdf2image')
+
+        # 不在這裡檢查 client：已快取的頁面不需要 Vision，離線也能重建；快取未命中時 _detect_words 才會報錯
         try:
-            pages = convert_from_path(pdf_path, dpi=300)
-            extracted_text = []
-            
-            for page in pages:
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                    page.save(temp_file.name, 'PNG')
-                    temp_image_path = temp_file.name
-                
-                try:
-                    page_text = self.extract_text_from_image(temp_image_path)
-                    if page_text.strip():
-                        extracted_text.append(page_text)
-                finally:
-                    if os.path.exists(temp_image_path):
-                        os.unlink(temp_image_path)
+            if page_numbers is None:
+                page_numbers = list(range(1, pdf2image.pdfinfo_from_path(pdf_path)['Pages'] + 1))
+            window_size = max(1, int(os.environ.get("OCR_PAGE_WINDOW", str(self.max_concurrency))))
+            page_texts = {}
+
+            for start in range(0, len(page_numbers), window_size):
+                window = page_numbers[start:start + window_size]
+                png_pages = run_in_extraction_pool(_rasterize_pdf_to_png, pdf_path, 300, window)
+                page_texts.update(zip(window, self.extract_text_from_images(png_pages)))
+                del png_pages
             
-            return "\n\n".join(extracted_text)
+            return page_texts
             
         except Exception as e:
             raise ValueError(f"PDF OCR 處理失敗: {e}")
 
+    def extract_text_from_pdf_pages(self, pdf_path: str) -> str:
+        """從 PDF 頁面中提取文字（通過轉換為圖片）"""
+        page_texts = self.extract_text_by_page(pdf_path)
+        return "\n\n".join(text for _, text in sorted(page_texts.items()) if text.strip())
+
+
+_ocr_instance = None
+_ocr_lock = threading.Lock()
+
+
+def get_ocr_client() -> GoogleVisionOCR:
+    """
+    取得行程內共用的 GoogleVisionOCR。
+    第一次真的需要 OCR（圖片或掃描頁）時才載入憑證並建立 gRPC 通道。
+    """
+    global _ocr_instance
+    if _ocr_instance is None:
+        with _ocr_lock:
+            if _ocr_instance is None:
+                _ocr_instance = GoogleVisionOCR()
+    return _ocr_instance
+
 
 class FileProcessor:
     """檔案處理器，支援多種格式"""
     
-    def __init__(self):
-        """初始化檔案處理器"""
-        self.ocr = GoogleVisionOCR()
+    @property
+    def ocr(self) -> GoogleVisionOCR:
+        """共用的 OCR 客戶端，延遲到第一次使用時才初始化"""
+        return get_ocr_client()
 
     @staticmethod
-    def _reconstruct_text_from_words(words: list) -> str:
+    def _group_words_into_lines(words: list, line_tolerance: float = 2) -> list:
         """
-        [共用函式] 根據帶座標的詞彙列表，重建包含縮排的完整文字。
-        此函式可同時被 pdfplumber 和 Google Vision OCR 的結果使用。
+        單趟掃描將已依 (top, x0) 排序的詞彙分行。
+        以 running maximum 追蹤目前行中 x0 最大的詞彙，不必每個詞都重新排序整行。
         """
-        if not words:
-            return ""
-
-        words.sort(key=lambda w: (w['top'], w['x0']))
-        
         lines = []
-        if not words:
-            return ""
         current_line = [words[0]]
-        line_tolerance = 2
-        for i in range(1, len(words)):
-            last_word_in_line = sorted(current_line, key=lambda w: w['x0'])[-1]
-            current_word = words[i]
-            
-            if abs(current_word['top'] - last_word_in_line['top']) <= line_tolerance:
+        rightmost = words[0]
+        for current_word in words[1:]:
+            if abs(current_word['top'] - rightmost['top']) <= line_tolerance:
                 current_line.append(current_word)
+                if current_word['x0'] >= rightmost['x0']:
+                    rightmost = current_word
             else:
-                lines.append(sorted(current_line, key=lambda w: w['x0']))
+                current_line.sort(key=lambda w: w['x0'])
+                lines.append(current_line)
                 current_line = [current_word]
-        lines.append(sorted(current_line, key=lambda w: w['x0']))
+                rightmost = current_word
+        current_line.sort(key=lambda w: w['x0'])
+        lines.append(current_line)
+        return lines
 
-        if not lines:
+    @staticmethod
+    def _reconstruct_text_from_words(words: list) -> str:
+        """
+        [共用函式] 根據帶座標的詞彙列表，重建包含縮排的完整文字。
+        此函式可同時被 pdfplumber 和 Google Vision OCR 的結果使用。
+        詞彙若帶有 'page' 欄位，會逐頁分行，不同頁面中 y 座標相同的詞彙不會被併成一行。
+        """
+        if not words:
             return ""
 
-        base_indent = min(line[0]['x0'] for line in lines if line)
+        pages = {}
+        for word in words:
+            pages.setdefault(word.get('page', 0), []).append(word)
+
+        lines = []
+        for page_number in sorted(pages):
+            page_words = pages[page_number]
+            page_words.sort(key=lambda w: (w['top'], w['x0']))
+            lines.extend(FileProcessor._group_words_into_lines(page_words))
+
+        base_indent = min(line[0]['x0'] for line in lines)
+        char_width = 5
         full_text_content = []
         
         for line_words in lines:
-            if not line_words: continue
-            
-            first_word_indent = line_words[0]['x0']
-            indent_pixels = first_word_indent - base_indent
-            char_width = 5 
+            indent_pixels = line_words[0]['x0'] - base_indent
             num_spaces = int(round(indent_pixels / char_width))
             
             line_text = ' '.join(w['text'] for w in line_words)
-            reconstructed_line = ' ' * num_spaces + line_text
-            full_text_content.append(reconstructed_line)
+            full_text_content.append(' ' * num_spaces + line_text)
             
         return "\n".join(full_text_content)
 
+    @staticmethod
+    def compute_content_hash(source: Union[str, BinaryIO], chunk_size: int = 1024 * 1024) -> str:
+        """
+        計算檔案內容的 SHA-256，用於偵測重複上傳。
+        可傳入檔案路徑或二進位串流；串流讀完後會回到原本的位置。
+        """
+        digest = hashlib.sha256()
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    digest.update(chunk)
+            return digest.hexdigest()
+
+        start = source.tell()
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+        source.seek(start)
+        return digest.hexdigest()
+
+    @staticmethod
+    def compute_text_hash(text: str) -> str:
+        """計算擷取文字（例如網頁內容）的 SHA-256，與 compute_content_hash 共用去重機制"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
     @staticmethod
     def preprocess_pseudocode(text: str) -> str:
         if not text:
@@ -188,51 +489,198 @@ class FileProcessor:
         return "\n".join(cleaned_lines)
     
     @staticmethod
-    def read_text_file(file_path: str) -> str:
+    def _decode_text_bytes(data: bytes) -> str:
+        """
+        將整份檔案位元組解碼為文字：先看 BOM，再試 UTF-8，
+        失敗時只拿前 ENCODING_SAMPLE_BYTES 位元組做編碼偵測，最後才依序嘗試常見的中文編碼。
+        """
+        for bom, encoding in _TEXT_BOMS:
+            if data.startswith(bom):
+                return data[len(bom):].decode(encoding, errors='replace')
+
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return FileProcessor.preprocess_pseudocode(f.read())
+            return data.decode('utf-8')
         except UnicodeDecodeError:
             pass
+
+        candidates = []
         try:
-            detected = from_path(file_path).best()
-            if detected: return FileProcessor.preprocess_pseudocode(str(detected))
+            from charset_normalizer import from_bytes
+            detected = from_bytes(data[:ENCODING_SAMPLE_BYTES]).best()
+            if detected and detected.encoding:
+                candidates.append(detected.encoding)
         except Exception:
             pass
-        encodings = ['big5', 'gbk', 'cp1252', 'latin1']
-        for encoding in encodings:
+        candidates.extend(['big5', 'gbk', 'cp1252'])
+
+        for encoding in candidates:
             try:
-                with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-                    return FileProcessor.preprocess_pseudocode(f.read())
-            except Exception: continue
-        raise ValueError(f"無法讀取檔案 {file_path}，編碼格式不支援")
+                return data.decode(encoding)
+            except (UnicodeDecodeError, LookupError):
+                continue
+        # 與舊版相同的最後手段：忽略無法解碼的位元組
+        return data.decode(candidates[0], errors='ignore')
 
-    def read_pdf_file(self, file_path: str) -> str:
+    @staticmethod
+    def read_text_file(file_path: str) -> str:
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            raise ValueError(f"無法讀取檔案 {file_path}: {e}")
+        return FileProcessor.preprocess_pseudocode(FileProcessor._decode_text_bytes(data))
+
+    @staticmethod
+    def _split_text_sections(text: str, max_chars: int = 4000) -> Iterator[str]:
+        """將長文字在空白行處切成約 max_chars 字的段落區塊（以換行串接即可還原原文）"""
+        section_lines = []
+        section_length = 0
+        for line in text.split('\n'):
+            if section_length >= max_chars and not line.strip():
+                yield '\n'.join(section_lines)
+                section_lines = []
+                section_length = 0
+            section_lines.append(line)
+            section_length += len(line) + 1
+        if section_lines:
+            yield '\n'.join(section_lines)
+
+    def iter_pdf_pages(self, file_path: str) -> Iterator[Dict[str, Any]]:
         """
-        讀取PDF檔案，優先使用幾何分析，若失敗則回退到 OCR。
+        依頁碼順序逐頁產生 PDF 文字，第 1 頁不必等到整份文件解析完。
+        頁面區段會分散到抽取行程池並行進行幾何分析；只有圖片的掃描頁才送 OCR。
+
+        每個區塊為 {'page': 頁碼, 'total_pages': 總頁數, 'method': 'text' | 'ocr', 'text': 文字}
         """
-        if pdfplumber is None:
-            raise ImportError("請安裝 pdfplumber 套件：pip install pdfplumber")
+        pdfplumber = _import_optional('pdfplumber', 'pdfplumber')
 
-        text = ""
         try:
             with pdfplumber.open(file_path) as pdf:
-                all_words = []
-                for page in pdf.pages:
-                    all_words.extend(page.extract_words(use_text_flow=True, x_tolerance=2))
-                text = self._reconstruct_text_from_words(all_words)
+                total_pages = len(pdf.pages)
         except Exception as e:
             print(f"使用 pdfplumber 進行幾何分析失敗: {e}。嘗試後備方案。")
-            text = ""
+            page_texts = self.ocr.extract_text_by_page(file_path)
+            for page_number, text in sorted(page_texts.items()):
+                yield {'page': page_number, 'total_pages': len(page_texts), 'method': 'ocr', 'text': text}
+            return
 
-        if len(text.strip()) < 50:
-            print("幾何分析未提取到足夠文字，啟動 OCR 掃描備用方案...")
+        if total_pages == 0:
+            return
+
+        # 先把所有區段提交到行程池，再依序取回，讓後面的頁面在處理前面頁面時並行解析
+        chunk_size = -(-total_pages // get_extraction_pool_size())
+        chunks = []
+        for first_page in range(1, total_pages + 1, chunk_size):
+            page_numbers = list(range(first_page, min(first_page + chunk_size, total_pages + 1)))
+            chunks.append((page_numbers, submit_to_extraction_pool(_extract_pdf_pages_text, file_path, page_numbers)))
+
+        for page_numbers, future in chunks:
             try:
-                text = self.ocr.extract_text_from_pdf_pages(file_path)
-            except Exception as ocr_error:
-                raise ValueError(f"PDF 檔案讀取失敗：主要方法和 OCR 備用方案均失敗。({ocr_error})")
+                page_texts = future.result()
+            except Exception as e:
+                print(f"第 {page_numbers[0]}-{page_numbers[-1]} 頁幾何分析失敗: {e}，改用 OCR。")
+                # 無法判斷頁面內容，視為含有圖片交給 OCR
+                page_texts = [(n, "", True) for n in page_numbers]
+
+            scanned_pages = [n for n, text, has_images in page_texts
+                             if has_images and len(text.strip()) < PDF_PAGE_MIN_TEXT_CHARS]
+            ocr_texts = {}
+            if scanned_pages:
+                print(f"偵測到 {len(scanned_pages)} 個掃描頁，僅對這些頁面進行 OCR...")
+                try:
+                    ocr_texts = self.ocr.extract_text_by_page(file_path, scanned_pages)
+                except Exception as ocr_error:
+                    print(f"掃描頁 OCR 失敗，僅保留文字頁內容: {ocr_error}")
+
+            for page_number, text, _ in page_texts:
+                if page_number in ocr_texts:
+                    yield {'page': page_number, 'total_pages': total_pages, 'method': 'ocr', 'text': ocr_texts[page_number]}
+                else:
+                    yield {'page': page_number, 'total_pages': total_pages, 'method': 'text', 'text': text}
+
+    def read_pdf_file(self, file_path: str) -> str:
+        """
+        讀取PDF檔案，逐頁決定處理方式：有文字層的頁面使用幾何分析，
+        只有圖片的掃描頁才送 OCR；整份文件仍提取不到足夠文字時再整份回退到 OCR。
+        """
+        pages = list(self.iter_pdf_pages(file_path))
+        text = "\n\n".join(page['text'] for page in pages if page['text'].strip())
+
+        if len(text.strip()) < PDF_DOC_MIN_TEXT_CHARS:
+            text = self._ocr_fallback_text(file_path, pages)
 
         return self.preprocess_pseudocode(text)
+
+    def _ocr_fallback_text(self, file_path: str, pages: List[Dict[str, Any]]) -> str:
+        """
+        整份 PDF 文字不足時的 OCR 備用方案。
+        iter_pdf_pages 已逐頁 OCR 過的掃描頁沿用其結果，只對其餘頁面 OCR，同一頁不會送 Vision 兩次。
+        """
+        print("幾何分析未提取到足夠文字，啟動 OCR 掃描備用方案...")
+        page_texts = {page['page']: page['text'] for page in pages if page['method'] == 'ocr'}
+        remaining = [page['page'] for page in pages if page['method'] != 'ocr']
+        try:
+            if remaining:
+                page_texts.update(self.ocr.extract_text_by_page(file_path, remaining))
+        except Exception as ocr_error:
+            raise ValueError(f"PDF 檔案讀取失敗：主要方法和 OCR 備用方案均失敗。({ocr_error})")
+        return "\n\n".join(text for _, text in sorted(page_texts.items()) if text.strip())
+
+    @classmethod
+    def iter_input_chunks(cls, input_data: str) -> Iterator[Dict[str, Any]]:
+        """
+        串流版的 process_input：逐一產生帶有中繼資料的文字區塊，
+        下游可邊讀邊處理（更新進度、檢查取消），不必等整份文件解析完。
+        PDF 以頁為單位，其他格式以段落區塊為單位。
+
+        每個區塊包含 index、input_type、page（非 PDF 為 None）、total_pages、method、text，
+        以 join_chunks 串接後與 process_input 的結果相同。
+        """
+        input_data = input_data.strip()
+        extractor = get_extractor(input_data) if os.path.exists(input_data) else None
+        if extractor and extractor[0] == 'pdf':
+            processor = cls()
+            # 累積的文字達到 PDF_DOC_MIN_TEXT_CHARS 前先暫存區塊，不足時與 read_pdf_file 一樣整份回退到 OCR
+            pending = []
+            seen_pages = []
+            enough_text = False
+            index = 0
+            for page in processor.iter_pdf_pages(input_data):
+                if not enough_text:
+                    seen_pages.append(page)
+                if not page['text'].strip():
+                    continue
+                chunk = {'input_type': 'pdf', **page, 'text': cls.preprocess_pseudocode(page['text'])}
+                if enough_text:
+                    yield {'index': index, **chunk}
+                    index += 1
+                    continue
+                pending.append((page['text'], chunk))
+                if len("\n\n".join(text for text, _ in pending).strip()) >= PDF_DOC_MIN_TEXT_CHARS:
+                    enough_text = True
+                    for index, (_, buffered) in enumerate(pending):
+                        yield {'index': index, **buffered}
+                    index = len(pending)
+            if not enough_text:
+                text = processor._ocr_fallback_text(input_data, seen_pages)
+                yield {'index': 0, 'input_type': 'pdf', 'page': None, 'total_pages': None,
+                       'method': 'ocr', 'text': cls.preprocess_pseudocode(text)}
+            return
+
+        content, input_type = cls.process_input(input_data)
+        for index, section in enumerate(cls._split_text_sections(content)):
+            yield {'index': index, 'input_type': input_type, 'page': None, 'total_pages': None,
+                   'method': 'text', 'text': section}
+
+    @staticmethod
+    def join_chunks(chunks: Iterable[Dict[str, Any]]) -> str:
+        """將 iter_input_chunks 產生的區塊串接回完整文字（頁面之間空一行）"""
+        parts = []
+        for chunk in chunks:
+            if parts:
+                parts.append("\n\n" if chunk.get('page') else "\n")
+            parts.append(chunk['text'])
+        return "".join(parts)
     
     def read_image_file(self, file_path: str) -> str:
         """讀取圖片檔案並進行 OCR，使用幾何分析重建排版"""
@@ -245,11 +693,10 @@ class FileProcessor:
     @staticmethod 
     def read_docx_file(file_path: str) -> str:
         """讀取Word檔案"""
-        if Document is None:
-            raise ImportError("請安裝 python-docx 套件：pip install python-docx")
+        docx = _import_optional('docx', 'python-docx')
         
         try:
-            doc = Document(file_path)
+            doc = docx.Document(file_path)
             text = []
             for paragraph in doc.paragraphs:
                 text.append(paragraph.text)
@@ -260,8 +707,7 @@ class FileProcessor:
     @staticmethod
     def read_html_file(file_path: str) -> str:
         """讀取HTML檔案"""
-        if BeautifulSoup is None:
-            raise ImportError("請安裝 beautifulsoup4 套件：pip install beautifulsoup4")
+        BeautifulSoup = _import_optional('bs4', 'beautifulsoup4').BeautifulSoup
         
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -279,59 +725,136 @@ class FileProcessor:
     
     @staticmethod
     def fetch_url_content_sync(url: str) -> str:
-        """同步版本的 URL 內容獲取 - 用於 Flask 路由"""
+        """
+        同步版本的 URL 內容獲取 - 用於 Flask 路由。
+        先以共用連線池抓取靜態 HTML，內容充足時直接擷取；只有文字過少或需要 JavaScript
+        才能顯示的頁面才交給瀏覽器渲染。
+        """
+        from ..core.event_loop import run_coroutine_sync
+        from . import http_cache
+
+        fetched, static_text = FileProcessor._fetch_static_text(url)
+        if static_text:
+            return static_text
+
         try:
-            # 在新的線程中創建事件循環
-            import asyncio
-            import threading
-            
-            result_container = {'result': None, 'error': None}
-            
-            def run_async():
-                try:
-                    # 創建新的事件循環
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    try:
-                        result = loop.run_until_complete(FileProcessor._fetch_url_async(url))
-                        result_container['result'] = result
-                    finally:
-                        loop.close()
-                except Exception as e:
-                    result_container['error'] = e
-            
-            # 在獨立線程中運行異步代碼
-            thread = threading.Thread(target=run_async)
-            thread.start()
-            thread.join(timeout=60)  # 60秒超時
-            
-            if result_container['error']:
-                raise result_container['error']
-            
-            if result_container['result']:
-                return result_container['result']
-            else:
+            # 交給共用的背景事件迴圈執行，60 秒逾時會取消爬取
+            result = run_coroutine_sync(FileProcessor._fetch_url_async(url, fetched), timeout=60)
+            if not result:
                 # 如果沒有結果，回退到傳統方法
-                return FileProcessor._fetch_url_fallback(url)
-                
+                result = FileProcessor._fetch_url_fallback(url, fetched)
         except Exception as e:
             print(f"Playwright 抓取失敗，使用傳統方法: {e}")
-            return FileProcessor._fetch_url_fallback(url)
+            result = FileProcessor._fetch_url_fallback(url, fetched)
+
+        if fetched:
+            http_cache.save_text(url, result, fetched)
+        return result
+
+    @staticmethod
+    def _fetch_static_text(url: str, timeout: float = 30) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        以 HTTP 抓取網址（單次請求時限 timeout 秒）並嘗試靜態擷取，回傳 (fetched, text)。
+        網頁未變更（304）時沿用上次的擷取結果；text 為 None 表示需要改用瀏覽器，
+        fetched 為 None 表示 HTTP 抓取失敗。
+        """
+        from . import http_cache
+
+        try:
+            fetched = http_cache.fetch(url, timeout=timeout)
+        except Exception as e:
+            print(f"HTTP 抓取失敗，改由瀏覽器載入: {e}")
+            return None, None
+
+        if fetched['not_modified']:
+            cached_text = http_cache.load_text(url)
+            if cached_text:
+                print(f"網頁未變更，沿用快取的擷取結果: {url}")
+                return fetched, cached_text
+
+        try:
+            page = FileProcessor._extract_static_page(url, fetched)
+        except Exception as e:
+            print(f"靜態 HTML 擷取失敗，改由瀏覽器載入: {e}")
+            page = None
+        if page is None:
+            return fetched, None
+
+        text = FileProcessor.preprocess_pseudocode(FileProcessor._format_scraped_page(page))
+        http_cache.save_text(url, text, fetched)
+        print(f"靜態 HTML 內容充足，略過瀏覽器: {url}")
+        return fetched, text
+
+    @staticmethod
+    def _extract_static_page(url: str, fetched: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        從伺服器回傳的 HTML 擷取標題、主要文字、表格與圖片（格式同 Playwright 爬取結果）。
+        文字少於 STATIC_FETCH_MIN_CHARS（預設 500）或看起來需要 JavaScript 才能顯示時回傳 None。
+        """
+        from urllib.parse import urljoin
+
+        content_type = (fetched.get('content_type') or '').lower()
+        if content_type and 'html' not in content_type:
+            return None
+        BeautifulSoup = _import_optional('bs4', 'beautifulsoup4').BeautifulSoup
+
+        # 不傳入 HTTP 標頭的編碼：未宣告 charset 時 requests 會猜成 ISO-8859-1，交給 bs4 依 <meta> 判斷
+        soup = BeautifulSoup(fetched['content'], _get_html_parser())
+
+        noscript_text = ' '.join(tag.get_text(' ') for tag in soup.find_all('noscript')).lower()
+        if any(marker in noscript_text for marker in JS_REQUIRED_MARKERS):
+            return None
+        for root_id in SPA_ROOT_IDS:
+            root = soup.find(id=root_id)
+            if root is not None and not root.get_text(strip=True):
+                return None
+
+        title = soup.title.get_text(strip=True) if soup.title else ''
+        for selector in STATIC_UNWANTED_SELECTORS:
+            for element in soup.select(selector):
+                element.decompose()
+
+        container = None
+        for selector in STATIC_TEXT_SELECTORS:
+            container = soup.select_one(selector)
+            if container is not None:
+                break
+        if container is None:
+            container = soup.body or soup
+
+        lines = (line.strip() for line in container.get_text(separator='\n').splitlines())
+        text_content = '\n'.join(line for line in lines if line)
+        min_chars = int(os.environ.get("STATIC_FETCH_MIN_CHARS", "500"))
+        if len(text_content) < min_chars:
+            return None
+
+        tables = []
+        for table in soup.find_all('table'):
+            rows = [[cell.get_text(' ', strip=True) for cell in row.find_all(['td', 'th'])]
+                    for row in table.find_all('tr')]
+            markdown = _table_to_markdown([row for row in rows if row])
+            if markdown:
+                tables.append({'markdown': markdown})
+
+        images = []
+        for img in soup.find_all('img'):
+            src = img.get('src') or ''
+            if src and not src.startswith('data:'):
+                images.append({'src': urljoin(url, src), 'alt': img.get('alt') or '', 'title': img.get('title') or ''})
+
+        return {'title': title, 'text_content': text_content, 'tables': tables, 'images': images}
     
     @staticmethod
-    def _fetch_url_fallback(url: str) -> str:
-        """傳統方法的 URL 抓取回退方案"""
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
+    def _fetch_url_fallback(url: str, fetched: Dict[str, Any] = None) -> str:
+        """傳統方法的 URL 抓取回退方案；fetched 為已由 http_cache.fetch 取得的回應"""
+        from . import http_cache
+
+        if fetched is None:
+            fetched = http_cache.fetch(url)
         
         try:
             from bs4 import BeautifulSoup
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = BeautifulSoup(fetched['content'], 'html.parser')
             
             # 移除不需要的元素
             for script in soup(["script", "style", "nav", "footer", "header", "aside"]):
@@ -356,7 +879,7 @@ class FileProcessor:
             return FileProcessor.preprocess_pseudocode(cleaned_text)
             
         except ImportError:
-            response_text = response.text
+            response_text = fetched['content'].decode(fetched['encoding'] or 'utf-8', errors='replace')
             # 同樣限制長度
             max_length = 100000
             if len(response_text) > max_length:
@@ -364,53 +887,16 @@ class FileProcessor:
             return FileProcessor.preprocess_pseudocode(response_text)
     
     @staticmethod
-    async def _fetch_url_async(url: str) -> str:
+    async def _fetch_url_async(url: str, fetched: Dict[str, Any] = None) -> str:
         """異步獲取 URL 內容的內部方法"""
         try:
-            from .playwright_scraper import scrape_single_page
+            from .playwright_scraper import get_scraper_pool
             
-            # 執行異步爬取
-            result = await scrape_single_page(url, headless=True)
+            # 以共用的瀏覽器池爬取，不必每個網址都啟動一次 Chromium
+            result = await get_scraper_pool().scrape(url)
             
             if result['status'] == 'success':
-                # 建構完整內容，包含表格
-                content_parts = []
-                
-                # 添加標題
-                if result['title']:
-                    content_parts.append(f"# {result['title']}\n")
-                
-                # 添加表格（優先處理）
-                if result['tables']:
-                    content_parts.append("## 表格資訊\n")
-                    for i, table in enumerate(result['tables']):
-                        if table['markdown']:
-                            content_parts.append(f"### 表格 {i+1}\n{table['markdown']}\n")
-                
-                # 添加主要文字內容
-                if result['text_content']:
-                    content_parts.append("## 主要內容\n")
-                    content_parts.append(result['text_content'])
-                
-                # 添加圖片資訊 - 只用原始連結，不做 base64 處理
-                if result['images']:
-                    content_parts.append("\n## 圖片資訊\n")
-                    image_count = 0
-                    for i, img in enumerate(result['images']):
-                        if image_count >= 5:
-                            break
-                        img_src = img['src']
-                        img_alt = img['alt'] or img['title'] or f"圖片 {i+1}"
-                        content_parts.append(f"![{img_alt}]({img_src})")
-                        image_count += 1
-                
-                full_content = '\n\n'.join(content_parts)
-                
-                # 限制最終內容大小，避免過度消耗 API 配額
-                max_length = 100000  # 100KB 文字限制
-                if len(full_content) > max_length:
-                    full_content = full_content[:max_length] + "\n\n... (內容過長，已截斷)"
-                
+                full_content = FileProcessor._format_scraped_page(result)
                 if len(full_content.strip()) > 50:  # 確保有足夠內容
                     return FileProcessor.preprocess_pseudocode(full_content)
             
@@ -419,35 +905,155 @@ class FileProcessor:
         except Exception as e:
             print(f"Playwright 爬取失敗，回退到傳統方法: {e}")
         
-        # 回退到傳統的 requests + BeautifulSoup 方法
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
+        # 回退到傳統的 requests + BeautifulSoup 方法（在執行緒中進行，不阻塞事件迴圈）
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, FileProcessor._fetch_url_fallback, url, fetched)
+
+    @staticmethod
+    def _format_scraped_page(result: Dict[str, Any]) -> str:
+        """將 Playwright 爬取結果組成送給 AI 的文字（標題、表格、主要內容、圖片連結）"""
+        # 建構完整內容，包含表格
+        content_parts = []
         
-        try:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(response.content, 'html.parser')
-            # 移除 script 和 style 標籤
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            text_content = soup.get_text(separator='\n').strip()
-            
-            # 限制內容長度，避免巨量文字消耗配額
-            max_length = 100000  # 100KB 文字限制
-            if len(text_content) > max_length:
-                text_content = text_content[:max_length] + "\n\n... (內容過長，已截斷)"
-            
-            return FileProcessor.preprocess_pseudocode(text_content)
-        except ImportError:
-            response_text = response.text
-            # 同樣限制長度
-            max_length = 100000
-            if len(response_text) > max_length:
-                response_text = response_text[:max_length] + "\n\n... (內容過長，已截斷)"
-            return FileProcessor.preprocess_pseudocode(response_text)
+        # 添加標題
+        if result['title']:
+            content_parts.append(f"# {result['title']}\n")
+        
+        # 添加表格（優先處理）
+        if result['tables']:
+            content_parts.append("## 表格資訊\n")
+            for i, table in enumerate(result['tables']):
+                if table['markdown']:
+                    content_parts.append(f"### 表格 {i+1}\n{table['markdown']}\n")
+        
+        # 添加主要文字內容
+        if result['text_content']:
+            content_parts.append("## 主要內容\n")
+            content_parts.append(result['text_content'])
+        
+        # 添加圖片資訊 - 只用原始連結，不做 base64 處理
+        if result['images']:
+            content_parts.append("\n## 圖片資訊\n")
+            for i, img in enumerate(result['images'][:5]):
+                img_alt = img['alt'] or img['title'] or f"圖片 {i+1}"
+                content_parts.append(f"![{img_alt}]({img['src']})")
+        
+        full_content = '\n\n'.join(content_parts)
+        
+        # 限制最終內容大小，避免過度消耗 API 配額
+        max_length = 100000  # 100KB 文字限制
+        if len(full_content) > max_length:
+            full_content = full_content[:max_length] + "\n\n... (內容過長，已截斷)"
+        return full_content
+
+    @staticmethod
+    def fetch_urls_content_sync(urls: List[str], deadline: float = None) -> List[Dict[str, Any]]:
+        """
+        同時抓取多個網址（批次匯入用），回傳與 urls 順序相同的結果：
+        {'url', 'status', 'title', 'content', 'error'}，status 為 success / timeout / error。
+        先並行嘗試靜態擷取，只有需要渲染的網址才交給瀏覽器池；
+        單一網址失敗或超過整批時限不影響其他網址。
+        """
+        import time
+        from ..core.event_loop import run_coroutine_sync
+        from . import http_cache
+
+        if deadline is None:
+            deadline = float(os.environ.get("SCRAPER_BATCH_DEADLINE", "120"))
+        started = time.monotonic()
+
+        # 靜態擷取最多使用一半的整批時限，其餘留給需要瀏覽器渲染的網址
+        static_budget = deadline / 2
+        request_timeout = max(1.0, min(30.0, static_budget))
+        # 與瀏覽器階段相同，同一主機同時進行的請求數受 SCRAPER_PER_HOST_LIMIT 限制
+        per_host_limit = max(1, int(os.environ.get("SCRAPER_PER_HOST_LIMIT", "2")))
+        host_semaphores = {}
+        for url in urls:
+            host_semaphores.setdefault(urlparse(url).netloc, threading.Semaphore(per_host_limit))
+
+        def fetch_static(url: str):
+            semaphore = host_semaphores[urlparse(url).netloc]
+            # 排隊等候同主機的名額也計入時限，逾時後不再發出請求
+            if not semaphore.acquire(timeout=max(0.0, static_budget - (time.monotonic() - started))):
+                raise TimeoutError('等候同主機的連線名額逾時')
+            try:
+                return FileProcessor._fetch_static_text(url, request_timeout)
+            finally:
+                semaphore.release()
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(8, len(urls))))
+        futures = {executor.submit(fetch_static, url): url for url in urls}
+        done, _ = wait(futures, timeout=static_budget)
+        # 不等待仍在進行的請求，逾時的網址直接標記為 timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        results = {}
+        fetched_by_url = {}
+        browser_urls = []
+        for future, url in futures.items():
+            if future not in done:
+                results[url] = {'url': url, 'status': 'timeout', 'title': '', 'content': '',
+                                'error': f'抓取超過時限（{int(static_budget)} 秒）'}
+                continue
+            try:
+                fetched, text = future.result()
+            except Exception as e:
+                fetched, text = None, None
+                print(f"靜態擷取失敗，改由瀏覽器載入: {e}")
+            fetched_by_url[url] = fetched
+            if text:
+                results[url] = {'url': url, 'status': 'success', 'title': FileProcessor._title_from_text(text),
+                                'content': text, 'error': None}
+            else:
+                browser_urls.append(url)
+
+        pages = None
+        if browser_urls:
+            remaining = max(1.0, deadline - (time.monotonic() - started))
+            try:
+                from .playwright_scraper import scrape_many
+                # 額外保留收尾時間，讓 scrape_many 自行取消逾時的網址並回傳部分結果
+                pages = run_coroutine_sync(scrape_many(browser_urls, deadline=remaining), timeout=remaining + 15)
+            except ImportError:
+                # Playwright 未安裝：以傳統方法擷取已抓取的內容
+                pages = None
+            except TimeoutError as e:
+                # 瀏覽器階段整體逾時：保留已完成的靜態結果，只把尚未完成的網址標記為逾時
+                print(f"批次瀏覽器爬取逾時: {e}")
+                pages = [{'url': url, 'status': 'timeout', 'title': '', 'error': '超過批次爬取時限'}
+                         for url in browser_urls]
+
+        if pages is None:
+            pages = [{'url': url, 'status': 'error', 'title': '', 'error': 'Playwright 未安裝'} for url in browser_urls]
+
+        for url, page in zip(browser_urls, pages):
+            fetched = fetched_by_url[url]
+            content = FileProcessor._format_scraped_page(page) if page['status'] == 'success' else ''
+            if len(content.strip()) > 50:
+                content = FileProcessor.preprocess_pseudocode(content)
+            else:
+                # 與單一網址的 fetch_url_content_sync 相同：瀏覽器失敗或內容不足時改用傳統方法擷取
+                status = 'error' if page['status'] == 'success' else page['status']
+                error = page.get('error') or '無法從該網址獲取有效內容'
+                # 靜態抓取已失敗且整批時限用盡時不再重新發出請求
+                if fetched is not None or time.monotonic() - started < deadline:
+                    try:
+                        content = FileProcessor._fetch_url_fallback(url, fetched)
+                    except Exception as e:
+                        content, error = '', str(e)
+                if not content.strip():
+                    results[url] = {'url': url, 'status': status, 'title': page['title'], 'content': '', 'error': error}
+                    continue
+            if fetched:
+                http_cache.save_text(url, content, fetched)
+            results[url] = {'url': url, 'status': 'success', 'title': page['title'], 'content': content, 'error': None}
+        return [results[url] for url in urls]
+
+    @staticmethod
+    def _title_from_text(text: str) -> str:
+        """擷取結果以「# 標題」開頭時取出標題"""
+        first_line = text.lstrip().split('\n', 1)[0]
+        return first_line[2:].strip() if first_line.startswith('# ') else ''
 
     # 已移除 base64 相關圖片處理，所有圖片只用原始連結
 
@@ -477,35 +1083,45 @@ class FileProcessor:
         
         # 檢查是否為檔案路徑
         if os.path.exists(input_data):
-            file_ext = os.path.splitext(input_data)[1].lower()
-            
-            if file_ext == '.txt':
+            extractor = get_extractor(input_data)
+            if extractor:
+                input_type, extract = extractor
+                return extract(processor, input_data), input_type
+
+            # 未註冊的格式：嘗試當作純文字檔案讀取
+            try:
                 content = cls.read_text_file(input_data)
                 return content, 'txt'
-            elif file_ext == '.pdf':
-                content = processor.read_pdf_file(input_data)
-                return content, 'pdf'
-            elif file_ext in ['.docx', '.doc']:
-                content = cls.read_docx_file(input_data)
-                return content, 'docx'
-            elif file_ext in ['.html', '.htm']:
-                content = cls.read_html_file(input_data)
-                return content, 'html'
-            elif file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp']:
-                # 圖片檔案，使用 OCR 提取文字
-                content = processor.read_image_file(input_data)
-                return content, 'image'
-            else:
-                # 嘗試當作純文字檔案讀取
-                try:
-                    content = cls.read_text_file(input_data)
-                    return content, 'txt'
-                except Exception:
-                    raise ValueError(f"不支援的檔案格式: {file_ext}")
+            except Exception:
+                file_ext = os.path.splitext(input_data)[1].lower()
+                raise ValueError(f"不支援的檔案格式: {file_ext}")
         
         # 當作純文字處理
         return input_data, 'text'
     
+    @classmethod
+    def extract_file_text_cached(cls, file_path: str) -> str:
+        """
+        擷取檔案文字，並以檔案的修改時間與大小快取結果；
+        檔案未變更時直接回傳上次的文字，不再重新執行 pdfplumber 或 OCR
+        """
+        stat = os.stat(file_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        key = os.path.abspath(file_path)
+        with _extracted_text_lock:
+            entry = _extracted_text_cache.get(key)
+            if entry is not None and entry[0] == signature:
+                _extracted_text_cache.move_to_end(key)
+                return entry[1]
+
+        content, _ = cls.process_input(file_path)
+        with _extracted_text_lock:
+            _extracted_text_cache[key] = (signature, content)
+            _extracted_text_cache.move_to_end(key)
+            while len(_extracted_text_cache) > EXTRACTED_TEXT_CACHE_ENTRIES:
+                _extracted_text_cache.popitem(last=False)
+        return content
+
     @staticmethod
     def save_markdown(content: str, file_path: str) -> None:
         """儲存Markdown檔案"""
@@ -520,6 +1136,37 @@ class FileProcessor:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         return f"{subject}/{timestamp}_{hash_str}.md"
 
+# --- 內建抽取器 ---
+
+@register_extractor('txt', extensions=['.txt'], mime_types=['text/plain'])
+def _extract_text(processor: FileProcessor, file_path: str) -> str:
+    return processor.read_text_file(file_path)
+
+
+@register_extractor('pdf', extensions=['.pdf'], mime_types=['application/pdf'])
+def _extract_pdf(processor: FileProcessor, file_path: str) -> str:
+    return processor.read_pdf_file(file_path)
+
+
+@register_extractor('docx', extensions=['.docx', '.doc'],
+                    mime_types=['application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+                                'application/msword'])
+def _extract_docx(processor: FileProcessor, file_path: str) -> str:
+    return processor.read_docx_file(file_path)
+
+
+@register_extractor('html', extensions=['.html', '.htm'], mime_types=['text/html'])
+def _extract_html(processor: FileProcessor, file_path: str) -> str:
+    return processor.read_html_file(file_path)
+
+
+@register_extractor('image', extensions=['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'],
+                    mime_types=['image/jpeg', 'image/png', 'image/bmp', 'image/gif', 'image/webp'])
+def _extract_image(processor: FileProcessor, file_path: str) -> str:
+    # 圖片檔案，使用 OCR 提取文字
+    return processor.read_image_file(file_path)
+
+
 class ContentValidator:
     """內容驗證器"""
     
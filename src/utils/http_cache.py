@@ -0,0 +1,182 @@
+"""
+網址抓取快取
+以共用的 requests.Session（連線池）抓取網頁，並將內容、ETag 與 Last-Modified 存在本機；
+再次匯入相同網址時以條件式請求重新驗證，伺服器回應 304 時直接沿用快取的內容與擷取結果；
+快取超過 HTTP_CACHE_MAX_AGE_DAYS 天或 HTTP_CACHE_MAX_MB 的部分會從最久未使用的開始刪除
+"""
+import os
+import json
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import disk_cache
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """取得共用的 HTTP Session，同一主機的連線會被重複使用"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'User-Agent': USER_AGENT})
+            _session = session
+        return _session
+
+
+def _get_cache_dir() -> Optional[str]:
+    """HTTP_CACHE_DIR 為快取目錄，設為空字串停用"""
+    return os.environ.get("HTTP_CACHE_DIR", "http_cache") or None
+
+
+def _cache_paths(url: str):
+    """回傳 (中繼資料路徑, 內容路徑)；以網址的 SHA-256 為鍵"""
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    base = os.path.join(_get_cache_dir(), key[:2], key)
+    return f"{base}.json", f"{base}.body"
+
+
+def _atomic_write(path: str, data: bytes):
+    """以暫存檔加替換的方式寫入，避免並行寫入產生半截檔案"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def _load_entry(url: str) -> Optional[Dict[str, Any]]:
+    """讀取快取的中繼資料；未命中或損毀時回傳 None"""
+    if not _get_cache_dir():
+        return None
+    meta_path, _ = _cache_paths(url)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get('url') != url:
+        return None
+    disk_cache.touch(meta_path)
+    return entry
+
+
+def _save_entry(url: str, entry: Dict[str, Any], body: bytes = None):
+    if not _get_cache_dir():
+        return
+    meta_path, body_path = _cache_paths(url)
+    try:
+        if body is not None:
+            _atomic_write(body_path, body)
+        _atomic_write(meta_path, json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+        disk_cache.prune_cache_dir(
+            _get_cache_dir(),
+            int(float(os.environ.get("HTTP_CACHE_MAX_MB", "200")) * 1024 * 1024),
+            float(os.environ.get("HTTP_CACHE_MAX_AGE_DAYS", "30")) * 86400
+        )
+    except OSError as e:
+        print(f"寫入網址快取失敗: {e}")
+
+
+def _read_body(url: str) -> Optional[bytes]:
+    _, body_path = _cache_paths(url)
+    try:
+        with open(body_path, 'rb') as f:
+            body = f.read()
+    except OSError:
+        return None
+    disk_cache.touch(body_path)
+    return body
+
+
+def fetch(url: str, timeout: float = 30) -> Dict[str, Any]:
+    """
+    抓取網址；快取中有 ETag / Last-Modified 時帶上 If-None-Match / If-Modified-Since 重新驗證。
+
+    Returns:
+        {'url', 'status_code', 'content'(bytes), 'encoding', 'content_type', 'etag', 'last_modified', 'not_modified'}；
+        伺服器回應 304 時 content 取自快取且 not_modified 為 True。
+        HTTP 錯誤狀態會拋出 requests.HTTPError。
+    """
+    session = get_http_session()
+    entry = _load_entry(url)
+
+    headers = {}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    response = session.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and entry:
+        body = _read_body(url)
+        if body is not None:
+            return {
+                'url': url,
+                'status_code': 304,
+                'content': body,
+                'encoding': entry.get('encoding'),
+                'content_type': entry.get('content_type', ''),
+                'etag': entry.get('etag'),
+                'last_modified': entry.get('last_modified'),
+                'not_modified': True,
+            }
+        # 快取內容遺失，改為無條件重新下載
+        response = session.get(url, timeout=timeout)
+
+    response.raise_for_status()
+    content_type = response.headers.get('Content-Type', '')
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if etag or last_modified:
+        # 新版本的內容取代舊快取，舊的擷取結果一併失效
+        _save_entry(url, {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'encoding': response.encoding,
+            'content_type': content_type,
+            'text': None,
+        }, body=response.content)
+    return {
+        'url': url,
+        'status_code': response.status_code,
+        'content': response.content,
+        'encoding': response.encoding,
+        'content_type': content_type,
+        'etag': etag,
+        'last_modified': last_modified,
+        'not_modified': False,
+    }
+
+
+def load_text(url: str) -> Optional[str]:
+    """取得上次由快取中這個版本的網頁擷取出的文字"""
+    entry = _load_entry(url)
+    return entry.get('text') if entry else None
+
+
+def save_text(url: str, text: str, fetched: Dict[str, Any]):
+    """
+    記錄 fetched（fetch 的回傳值）這個版本的擷取結果。
+    沒有驗證資訊（未快取）或快取已被更新版本取代時不記錄。
+    """
+    entry = _load_entry(url)
+    if entry is None or not text:
+        return
+    if (entry.get('etag'), entry.get('last_modified')) != (fetched.get('etag'), fetched.get('last_modified')):
+        return
+    entry['text'] = text
+    _save_entry(url, entry)
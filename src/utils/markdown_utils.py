@@ -1,104 +1,201 @@
 import re
-from typing import Dict, Any
-
-
-def detect_and_fence_indented_code(text: str) -> str:
-    """Wrap likely pseudo-code blocks with ```pseudocode fences."""
-    if not text:
-        return text
-
-    lines = text.splitlines()
-    result = []
-    buffer: list[str] = []
-    in_fence = False
-
-    def flush_buffer():
-        nonlocal buffer
-        if buffer:
-            # Determine if the buffer content is likely a code block
-            # Criteria: at least two lines, and either all lines are indented,
-            # or it contains common programming keywords.
-            is_code_block = False
-            if len(buffer) >= 2:
-                block_text = "\n".join(buffer)
-
-                # Criteria 1: Explicitly indented lines (at least 2 spaces or 1 tab)
-                indent_check = all(re.match(r"^( |\t){2,}", line) for line in buffer if line.strip())
-
-                # Criteria 2: Contains common programming keywords, even if not perfectly indented
-                keyword_check = re.search(
-                    r"\b(for|if|while|BEGIN|END|PRINT|READ|FUNCTION|PROCEDURE|RETURN|DECLARE|SET|GET|CALL|LOOP|UNTIL|DO|THEN|ELSE|ELIF|CASE|SWITCH|BREAK|CONTINUE|EXIT|INPUT|OUTPUT)\b",
-                    block_text,
-                    re.IGNORECASE
-                )
-
-                # Criteria 3: Single line that looks like code (e.g., "n←n−1")
-                single_line_code_check = len(buffer) == 1 and re.search(r"[a-zA-Z0-9]+\s*[\+\-\*\/=<>!←→]+\s*[a-zA-Z0-9]+", block_text)
-
-                if indent_check or keyword_check or single_line_code_check:
-                    is_code_block = True
-
-            if is_code_block:
-                result.append("```pseudocode")
-                # Re-indent the code if it's a single line or poorly indented
-                if len(buffer) == 1 or not indent_check:
-                    # Attempt to re-indent to a standard 4-space indentation
-                    re_indented_buffer = []
-                    for line in buffer:
-                        stripped_line = line.lstrip()
-                        if stripped_line: # Only indent non-empty lines
-                            re_indented_buffer.append("    " + stripped_line)
-                        else:
-                            re_indented_buffer.append("") # Preserve empty lines
-                    result.extend(re_indented_buffer)
-                else:
-                    result.extend(buffer)  # Preserve original indentation if already well-indented
-                result.append("```")
+from collections import deque
+from typing import Dict, Any, Iterable, Iterator, List
+
+# All patterns are compiled once at import time; the formatters below walk the
+# text line by line a single time instead of re-splitting it for every step.
+ANSWER_HEADING_PATTERN = re.compile(r"^\s*(答案|解答|參考答案|建議|說明|解析)[\s:：]", re.I)
+INDENTED_CANDIDATE_PATTERN = re.compile(r"^(\t| {4,})")
+INDENTED_LINE_PATTERN = re.compile(r"^( |\t){2,}")
+CODE_KEYWORD_PATTERN = re.compile(
+    r"\b(for|if|while|BEGIN|END|PRINT|READ|FUNCTION|PROCEDURE|RETURN|DECLARE|SET|GET|CALL|LOOP|UNTIL|DO|THEN|ELSE|ELIF|CASE|SWITCH|BREAK|CONTINUE|EXIT|INPUT|OUTPUT)\b",
+    re.IGNORECASE
+)
+FENCE_SPEC_PATTERN = re.compile(r"\s*(\w+)?")
+NUMBERED_LINE_PATTERN = re.compile(r'^(\s*)(\d+)\.\s+(.+)$')
+NUMBERED_PREFIX_PATTERN = re.compile(r'^(\s*)(\d+)\.\s+')
+
+# (language, pattern) in priority order; the first match wins
+LANGUAGE_PATTERNS = [(lang, re.compile(pattern, flags)) for lang, pattern, flags in [
+    ("python", r"def |import |print\(|self\.|elif |for |while |class |async |await ", 0),
+    ("c", r"#include|<iostream>|int main\(|printf\(|std::cout|void |class |struct |new |delete |nullptr ", 0),
+    ("pseudocode", r"algorithm|begin|end|read|write|if then else|for each|while do|function |procedure |return ", 0),
+    ("javascript", r"function |const |let |var |console\\.log\(|document\\.getelementbyid|=> |async |await |import |export |class ", 0),
+    ("java", r"public class |static void main|system\\.out\\.println|import |package |new |try |catch |finally ", 0),
+    ("sql", r"select |from |where |insert into |update |delete from|create table |alter table |join |group by |order by ", 0),
+    ("html", r"<html|<body|<div|<p|<a href|<script|<style|<head|<title ", 0),
+    ("css", r"body \{|\\.class \{|#id \{|color:|font-size:|background-color:|display:|padding:|margin: ", 0),
+    ("php", r"<\?php|echo |\\\\$this->|function |class |namespace |use |require |include ", 0),
+    ("ruby", r"def |end |puts |require |class |module |do |if |unless ", 0),
+    ("go", r"package main|func main|fmt\\.println|import |var |const |type |struct |interface ", 0),
+    ("swift", r"import swift|func |var |let |print\(|class |struct |enum |protocol ", 0),
+    ("kotlin", r"fun main|println\(|var |val |class |object |interface |import |package ", 0),
+    ("rust", r"fn main|println!|let mut|struct |enum |impl |trait |mod |use ", 0),
+    ("bash", r"#!/bin/bash|echo |if \[|for i in|fi |esac |case |while |do |done ", 0),
+    ("json", r"\{|\}|\[|\]|\"\w+\": ", 0),
+    ("xml", r"<\?xml|<root>|<element attribute=\\\"value\\\"> ", 0),
+    ("markdown", r"^#+ |^- |^\* |^> |^``` ", re.MULTILINE),
+]]
+
+
+def _fence_indented_block(buffer: List[str], result: List[str]) -> None:
+    """Append buffered indented lines to result, wrapped in ```pseudocode if they look like code."""
+    # Criteria: at least two lines, and either all lines are indented,
+    # or it contains common programming keywords.
+    if len(buffer) >= 2:
+        # Criteria 1: Explicitly indented lines (at least 2 spaces or 1 tab)
+        indent_check = all(INDENTED_LINE_PATTERN.match(line) for line in buffer if line.strip())
+        # Criteria 2: Contains common programming keywords, even if not perfectly indented
+        if indent_check or any(CODE_KEYWORD_PATTERN.search(line) for line in buffer):
+            result.append("```pseudocode")
+            if indent_check:
+                result.extend(buffer)  # Preserve original indentation if already well-indented
             else:
-                result.extend(buffer)
-            buffer = []
+                # Re-indent to a standard 4-space indentation, preserving empty lines
+                for line in buffer:
+                    stripped_line = line.lstrip()
+                    result.append("    " + stripped_line if stripped_line else "")
+            result.append("```")
+            return
+    result.extend(buffer)
+
+
+def _tag_fence_language(opening: str, body: List[str]) -> str:
+    """Return the opening fence line with a language, guessing it from the body when missing."""
+    prefix, _, spec = opening.partition("```")
+    match = FENCE_SPEC_PATTERN.fullmatch(spec)
+    if not match:
+        return opening
+    lang = match.group(1) or guess_programming_language("\n".join(body))
+    return f"{prefix}```{lang}"
+
+
+def _format_lines(lines: Iterable[str], tag_languages: bool) -> str:
+    """
+    Single pass over the lines: fence indented pseudo-code and, when tag_languages is set,
+    add a guessed language to fenced blocks that do not declare one.
+    """
+    result: List[str] = []
+    buffer: List[str] = []
+    in_fence = False
+    fence_start = 0  # index of the current opening fence in result
 
     for line in lines:
-        stripped = line.strip()
-        if stripped.startswith("```"):
-            flush_buffer()
+        if line.strip().startswith("```"):
+            if buffer:
+                _fence_indented_block(buffer, result)
+                buffer = []
+            if in_fence:
+                if tag_languages:
+                    result[fence_start] = _tag_fence_language(result[fence_start], result[fence_start + 1:])
+            else:
+                fence_start = len(result)
             in_fence = not in_fence
             result.append(line)
             continue
 
-        if not in_fence and re.match(r"^(\t| {4,})", line):
+        if not in_fence and INDENTED_CANDIDATE_PATTERN.match(line):
             buffer.append(line)
         else:
-            flush_buffer()
+            if buffer:
+                _fence_indented_block(buffer, result)
+                buffer = []
             result.append(line)
 
-    flush_buffer()
+    if buffer:
+        _fence_indented_block(buffer, result)
     return "\n".join(result)
 
+
+def _drop_answer_headings(lines: Iterable[str]) -> Iterator[str]:
+    """Skip lines that start an answer or explanation, except inside fenced code."""
+    in_code_block = False
+    for line in lines:
+        if line.strip().startswith("```"):
+            in_code_block = not in_code_block
+            yield line
+        elif in_code_block or not ANSWER_HEADING_PATTERN.match(line):
+            yield line
+
+
+def _strip_outer_blank_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Streaming equivalent of "\\n".join(lines).strip() followed by splitlines()."""
+    held = None  # last non-blank line, emitted once more content follows
+    blanks: List[str] = []
+    for line in lines:
+        if not line.strip():
+            if held is not None:
+                blanks.append(line)
+            continue
+        if held is None:
+            line = line.lstrip()
+        else:
+            yield held
+            yield from blanks
+            blanks = []
+        held = line
+    if held is not None:
+        yield held.rstrip()
+
+
+def detect_and_fence_indented_code(text: str) -> str:
+    """Wrap likely pseudo-code blocks with ```pseudocode fences."""
+    if not text:
+        return text
+    return _format_lines(text.splitlines(), tag_languages=False)
+
+
 def format_code_blocks(text: str) -> str:
     """Format fenced code blocks and detect indented pseudo-code."""
-    text = detect_and_fence_indented_code(text)
+    if not text:
+        return text
+    return _format_lines(text.splitlines(), tag_languages=True)
 
-    def replace_code_block(match):
-        lang_specifier = match.group(1)
-        code_content = match.group(2)
 
-        if lang_specifier:
-            lang = lang_specifier
-        else:
-            lang = guess_programming_language(code_content)
+def sanitize_question_text(text: str, tag_languages: bool = False) -> str:
+    """
+    Remove answer / explanation heading lines (keeping fenced code intact), trim the text
+    and fence indented pseudo-code, all in one pass.
+
+    Args:
+        text: question text from the user or the model
+        tag_languages: also add guessed languages to fenced code, as format_code_blocks does
+    """
+    if not text:
+        return text
+    lines = _strip_outer_blank_lines(_drop_answer_headings(text.splitlines()))
+    return _format_lines(lines, tag_languages=tag_languages)
+
+
+def fix_markdown_numbering(text: str) -> str:
+    """只修正明顯重複的阿拉伯數字編號問題，保持所有其他格式不變"""
+    if not text:
+        return text
+
+    result_lines = []
+    # 前 4 行內的編號行：(行號, 縮排長度, 編號)
+    recent = deque(maxlen=4)
+
+    for i, line in enumerate(text.split('\n')):
+        prefix_match = NUMBERED_PREFIX_PATTERN.match(line)
+        arabic_match = NUMBERED_LINE_PATTERN.match(line) if prefix_match else None
+
+        if arabic_match:
+            indent, old_number, content = arabic_match.groups()
+            # 向前查找同層級的最近編號，只有在明確發現重複編號時才修正
+            for j, prev_indent, prev_number in reversed(recent):
+                if j < i - 4:
+                    break
+                if prev_indent == len(indent):
+                    if int(old_number) == prev_number:
+                        line = f"{indent}{prev_number + 1}. {content}"
+                    break
 
-        return f"""```{
-lang}
-{
-code_content}```"""
+        result_lines.append(line)
+        if prefix_match:
+            recent.append((i, len(prefix_match.group(1)), int(prefix_match.group(2))))
 
-    # Regex to find code blocks.
-    # It captures the language specifier (optional) and then all content until the closing ```
-    # The `re.DOTALL` flag allows '.' to match newlines.
-    # We make the newline after the language specifier part of the content capture.
-    pattern = r"```\s*(\w+)?\n([\s\S]*?)```"
-    return re.sub(pattern, replace_code_block, text, flags=re.DOTALL)
+    return '\n'.join(result_lines)
 
 def format_answer_text(text: str) -> str:
     """Clean and wrap answer content in a consistent Markdown block."""
@@ -132,60 +229,9 @@ def guess_programming_language(code: str) -> str:
     if not code:
         return ""
 
-    # Python keywords
-    if re.search(r"def |import |print\(|self\.|elif |for |while |class |async |await ", code):
-        return "python"
-    # C/C++ keywords
-    if re.search(r"#include|<iostream>|int main\(|printf\(|std::cout|void |class |struct |new |delete |nullptr ", code):
-        return "c"
-    # Pseudocode indicators
-    if re.search(r"algorithm|begin|end|read|write|if then else|for each|while do|function |procedure |return ", code):
-        return "pseudocode"
-    # JavaScript keywords
-    if re.search(r"function |const |let |var |console\\.log\(|document\\.getelementbyid|=> |async |await |import |export |class ", code):
-        return "javascript"
-    # Java keywords
-    if re.search(r"public class |static void main|system\\.out\\.println|import |package |new |try |catch |finally ", code):
-        return "java"
-    # SQL keywords
-    if re.search(r"select |from |where |insert into |update |delete from|create table |alter table |join |group by |order by ", code):
-        return "sql"
-    # HTML indicators
-    if re.search(r"<html|<body|<div|<p|<a href|<script|<style|<head|<title ", code):
-        return "html"
-    # CSS indicators
-    if re.search(r"body \{|\\.class \{|#id \{|color:|font-size:|background-color:|display:|padding:|margin: ", code):
-        return "css"
-    # PHP indicators
-    if re.search(r"<\?php|echo |\\\\$this->|function |class |namespace |use |require |include ", code):
-        return "php"
-    # Ruby indicators
-    if re.search(r"def |end |puts |require |class |module |do |if |unless ", code):
-        return "ruby"
-    # Go indicators
-    if re.search(r"package main|func main|fmt\\.println|import |var |const |type |struct |interface ", code):
-        return "go"
-    # Swift indicators
-    if re.search(r"import swift|func |var |let |print\(|class |struct |enum |protocol ", code):
-        return "swift"
-    # Kotlin indicators
-    if re.search(r"fun main|println\(|var |val |class |object |interface |import |package ", code):
-        return "kotlin"
-    # Rust indicators
-    if re.search(r"fn main|println!|let mut|struct |enum |impl |trait |mod |use ", code):
-        return "rust"
-    # Shell script indicators
-    if re.search(r"#!/bin/bash|echo |if \[|for i in|fi |esac |case |while |do |done ", code):
-        return "bash"
-    # JSON indicators
-    if re.search(r"\{|\}|\[|\]|\"\w+\": ", code):
-        return "json"
-    # XML indicators
-    if re.search(r"<\?xml|<root>|<element attribute=\\\"value\\\"> ", code):
-        return "xml"
-    # Markdown indicators (basic)
-    if re.search(r"^#+ |^- |^\* |^> |^``` ", code, re.MULTILINE):
-        return "markdown"
+    for lang, pattern in LANGUAGE_PATTERNS:
+        if pattern.search(code):
+            return lang
 
     return "text" # Default to text if not recognized
 
@@ -4,25 +4,213 @@ Playwright 網頁爬取器
 """
 
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+import os
 import re
+import time
+import atexit
+import asyncio
 import logging
+import threading
+from contextlib import asynccontextmanager
 
 logger = logging.getLogger(__name__)
 
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# 內容擷取只讀取 DOM 文字、表格與圖片 src，這些資源不需要下載
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font'}
+BLOCKED_TRACKER_DOMAINS = (
+    'google-analytics.com',
+    'googletagmanager.com',
+    'googlesyndication.com',
+    'googleadservices.com',
+    'doubleclick.net',
+    'adservice.google.com',
+    'facebook.net',
+    'hotjar.com',
+    'clarity.ms',
+    'scorecardresearch.com',
+    'segment.io',
+    'mixpanel.com',
+)
+VALID_WAIT_UNTIL = ('commit', 'domcontentloaded', 'load', 'networkidle')
+
+# 擷取前從 DOM 移除的元素
+UNWANTED_SELECTORS = [
+    'script',
+    'style',
+    'noscript',
+    '.advertisement',
+    '.ads',
+    '.ad',
+    '.sidebar',
+    '.footer',
+    '.header-ads',
+    '.popup',
+    '.modal',
+    '.cookie-notice',
+    '[class*="ad-"]',
+    '[id*="ad-"]',
+    '[class*="ads-"]',
+    '[id*="ads-"]'
+]
+
+# 主要內容（HTML）依序嘗試的容器，內容超過 100 字元才採用，否則使用 body
+CONTENT_SELECTORS = [
+    'main',
+    'article',
+    '.content',
+    '.main-content',
+    '.post-content',
+    '.article-content',
+    '.entry-content',
+    '#content',
+    '#main',
+    '.container .row',  # Bootstrap 佈局
+    '.content-wrapper'
+]
+
+# 純文字依序嘗試的容器，找不到時使用 body
+TEXT_SELECTORS = ['main', 'article', '.content', '.main-content', '#content']
+
+# 在頁面中執行一次即取回所有需要的資料，避免每個選擇器一次 CDP 往返
+EXTRACTION_SCRIPT = """
+({unwantedSelectors, contentSelectors, textSelectors}) => {
+    for (const selector of unwantedSelectors) {
+        try {
+            document.querySelectorAll(selector).forEach(el => el.remove());
+        } catch (e) {
+            // 忽略無效的選擇器，繼續移除其他元素
+        }
+    }
+
+    const body = document.body;
+
+    let content = null;
+    for (const selector of contentSelectors) {
+        const element = document.querySelector(selector);
+        if (element && element.innerHTML.trim().length > 100) {
+            content = element.innerHTML;
+            break;
+        }
+    }
+    if (content === null) {
+        content = body ? body.innerHTML : '';
+    }
+
+    let textContent = null;
+    for (const selector of textSelectors) {
+        const element = document.querySelector(selector);
+        if (element) {
+            textContent = element.innerText || element.textContent;
+            break;
+        }
+    }
+    if (textContent === null) {
+        textContent = body ? (body.innerText || body.textContent || '') : '';
+    }
+
+    function convertTableToMarkdown(headers, rows) {
+        if (!rows || rows.length === 0) return '';
+        let markdown = '';
+        if (headers && headers.length > 0) {
+            markdown += '| ' + headers.join(' | ') + ' |\\n';
+            markdown += '| ' + headers.map(() => '---').join(' | ') + ' |\\n';
+        }
+        rows.forEach(row => {
+            if (row && row.length > 0) {
+                markdown += '| ' + row.join(' | ') + ' |\\n';
+            }
+        });
+        return markdown;
+    }
+
+    const tables = Array.from(document.querySelectorAll('table')).map((table, index) => {
+        const headers = Array.from(table.querySelectorAll('th')).map(th => th.textContent.trim());
+        const data = Array.from(table.querySelectorAll('tr')).map(row => {
+            return Array.from(row.querySelectorAll('td, th')).map(cell => cell.textContent.trim());
+        }).filter(row => row.length > 0);
+        return {
+            index: index,
+            headers: headers,
+            rows: data,
+            markdown: convertTableToMarkdown(headers, data)
+        };
+    });
+
+    const images = Array.from(document.querySelectorAll('img')).map(img => ({
+        src: img.src || '',
+        alt: img.alt || '',
+        title: img.title || '',
+        width: img.naturalWidth || img.width || 0,
+        height: img.naturalHeight || img.height || 0
+    })).filter(img => img.src && !img.src.startsWith('data:'));
+
+    return {
+        title: document.title || '',
+        content: content,
+        text_content: textContent,
+        tables: tables,
+        images: images
+    };
+}
+"""
+
+
+def _get_host(url: str) -> str:
+    """取出網址的主機名稱（小寫、不含連接埠）"""
+    return url.split('//', 1)[-1].split('/', 1)[0].split(':', 1)[0].lower()
+
+
+def _is_tracker_url(url: str) -> bool:
+    """網址的主機是否屬於已知的追蹤/廣告網域"""
+    host = _get_host(url)
+    return any(host == domain or host.endswith('.' + domain) for domain in BLOCKED_TRACKER_DOMAINS)
+
+
+def _failed_result(url: str, query: str, status: str, error: str) -> Dict[str, Any]:
+    """爬取失敗時回傳的結果，欄位與成功時相同"""
+    return {
+        'url': url,
+        'title': '',
+        'content': '',
+        'text_content': '',
+        'tables': [],
+        'images': [],
+        'query': query,
+        'status': status,
+        'error': error
+    }
+
+
 class PlaywrightScraper:
     """使用 Playwright 的進階網頁爬取器"""
     
-    def __init__(self, headless: bool = True, timeout: int = 30000):
+    def __init__(self, headless: bool = True, timeout: int = 30000, block_resources: bool = None,
+                 wait_until: str = None, network_idle_timeout: int = None):
         """
         初始化爬取器
         
         Args:
             headless: 是否使用無頭瀏覽器模式
             timeout: 頁面載入超時時間（毫秒）
+            block_resources: 是否攔截圖片、影音、字型與追蹤腳本，預設讀取 SCRAPER_BLOCK_RESOURCES（true）
+            wait_until: page.goto 的就緒條件，預設讀取 SCRAPER_WAIT_UNTIL（domcontentloaded）
+            network_idle_timeout: 就緒後再等待 networkidle 的上限（毫秒），0 表示不等待，
+                                  預設讀取 SCRAPER_NETWORK_IDLE_TIMEOUT（2000）
         """
         self.headless = headless
         self.timeout = timeout
+        if block_resources is None:
+            block_resources = os.environ.get("SCRAPER_BLOCK_RESOURCES", "true").lower() not in ('0', 'false', 'no')
+        self.block_resources = block_resources
+        self.wait_until = wait_until or os.environ.get("SCRAPER_WAIT_UNTIL", "domcontentloaded")
+        if self.wait_until not in VALID_WAIT_UNTIL:
+            raise ValueError(f"SCRAPER_WAIT_UNTIL 必須是 {', '.join(VALID_WAIT_UNTIL)} 之一")
+        if network_idle_timeout is None:
+            network_idle_timeout = int(os.environ.get("SCRAPER_NETWORK_IDLE_TIMEOUT", "2000"))
+        self.network_idle_timeout = network_idle_timeout
         self.browser = None
         self.context = None
         
@@ -38,19 +226,44 @@ class PlaywrightScraper:
     async def start(self):
         """啟動瀏覽器"""
         try:
-            self.playwright = await async_playwright().start()
-            self.browser = await self.playwright.chromium.launch(
-                headless=self.headless,
-                args=['--no-sandbox', '--disable-dev-shm-usage']
-            )
-            self.context = await self.browser.new_context(
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                viewport={'width': 1920, 'height': 1080}
-            )
+            await self.launch_browser()
+            self.context = await self.new_context()
             logger.info("Playwright 瀏覽器已啟動")
         except Exception as e:
             logger.error(f"啟動 Playwright 瀏覽器失敗: {e}")
             raise
+
+    async def launch_browser(self):
+        """只啟動瀏覽器行程，不建立瀏覽器上下文"""
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(
+            headless=self.headless,
+            args=['--no-sandbox', '--disable-dev-shm-usage']
+        )
+
+    async def new_context(self):
+        """以預設的 User-Agent 與視窗大小建立新的瀏覽器上下文，並視設定攔截不需要的資源"""
+        context = await self.browser.new_context(
+            user_agent=USER_AGENT,
+            viewport={'width': 1920, 'height': 1080}
+        )
+        if self.block_resources:
+            await context.route('**/*', self._handle_route)
+        return context
+
+    @staticmethod
+    async def _handle_route(route):
+        """中止圖片、影音、字型與追蹤請求，其餘照常送出"""
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or _is_tracker_url(request.url):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    @property
+    def is_connected(self) -> bool:
+        """瀏覽器行程是否仍可使用（健康檢查）"""
+        return self.browser is not None and self.browser.is_connected()
             
     async def close(self):
         """關閉瀏覽器"""
@@ -78,23 +291,30 @@ class PlaywrightScraper:
         """
         if not self.context:
             await self.start()
-            
+        return await self.scrape_in_context(self.context, url, query)
+
+    async def scrape_in_context(self, context, url: str, query: str = "") -> Dict[str, Any]:
+        """在指定的瀏覽器上下文中開新分頁爬取網頁，供 ScraperPool 共用同一個瀏覽器"""
         page = None
         try:
-            page = await self.context.new_page()
+            page = await context.new_page()
             
             # 設置超時
             page.set_default_timeout(self.timeout)
             
             # 訪問頁面
             logger.info(f"正在載入頁面: {url}")
-            response = await page.goto(url, wait_until='domcontentloaded')
+            response = await page.goto(url, wait_until=self.wait_until)
             
             if not response or response.status >= 400:
                 raise Exception(f"頁面載入失敗，狀態碼: {response.status if response else 'None'}")
             
-            # 等待頁面完全載入
-            await page.wait_for_load_state('networkidle', timeout=10000)
+            # 給前端渲染的頁面一小段時間穩定；持續有連線（輪詢、長連線）的頁面不視為失敗
+            if self.network_idle_timeout > 0 and self.wait_until != 'networkidle':
+                try:
+                    await page.wait_for_load_state('networkidle', timeout=self.network_idle_timeout)
+                except PlaywrightTimeoutError:
+                    logger.info(f"等待 networkidle 逾時，直接擷取目前內容: {url}")
             
             # 提取頁面資訊
             page_data = await self._extract_page_content(page)
@@ -102,7 +322,7 @@ class PlaywrightScraper:
             # 添加元資訊
             page_data.update({
                 'url': url,
-                'title': await page.title() or '',
+                'title': page_data.get('title') or await page.title() or '',
                 'query': query,
                 'status': 'success'
             })
@@ -112,250 +332,254 @@ class PlaywrightScraper:
             
         except PlaywrightTimeoutError:
             logger.error(f"頁面載入超時: {url}")
-            return {
-                'url': url,
-                'title': '',
-                'content': '',
-                'text_content': '',
-                'tables': [],
-                'images': [],
-                'query': query,
-                'status': 'timeout',
-                'error': '頁面載入超時'
-            }
+            return _failed_result(url, query, 'timeout', '頁面載入超時')
         except Exception as e:
             logger.error(f"爬取頁面失敗 {url}: {e}")
-            return {
-                'url': url,
-                'title': '',
-                'content': '',
-                'text_content': '',
-                'tables': [],
-                'images': [],
-                'query': query,
-                'status': 'error',
-                'error': str(e)
-            }
+            return _failed_result(url, query, 'error', str(e))
         finally:
             if page:
                 await page.close()
     
     async def _extract_page_content(self, page) -> Dict[str, Any]:
-        """提取頁面內容"""
-        
-        # 移除不需要的元素
-        await self._remove_unwanted_elements(page)
-        
-        # 提取主要內容
-        content = await self._extract_main_content(page)
-        
-        # 提取純文字內容
-        text_content = await self._extract_text_content(page)
-        
-        # 提取表格
-        tables = await self._extract_tables(page)
-        
-        # 提取圖片資訊
-        images = await self._extract_images(page)
-        
+        """以單一次 page.evaluate 取回標題、主要內容、純文字、表格與圖片"""
+        try:
+            page_data = await page.evaluate(EXTRACTION_SCRIPT, {
+                'unwantedSelectors': UNWANTED_SELECTORS,
+                'contentSelectors': CONTENT_SELECTORS,
+                'textSelectors': TEXT_SELECTORS,
+            })
+        except Exception as e:
+            logger.error(f"提取頁面內容失敗: {e}")
+            page_data = {}
+
         return {
-            'content': content,
-            'text_content': text_content,
-            'tables': tables,
-            'images': images
+            'title': page_data.get('title') or '',
+            'content': page_data.get('content') or '',
+            'text_content': self._clean_text(page_data.get('text_content') or ''),
+            'tables': page_data.get('tables') or [],
+            'images': page_data.get('images') or []
         }
-    
-    async def _remove_unwanted_elements(self, page):
-        """移除不需要的頁面元素"""
-        unwanted_selectors = [
-            'script',
-            'style', 
-            'noscript',
-            '.advertisement',
-            '.ads',
-            '.ad',
-            '.sidebar',
-            '.footer',
-            '.header-ads',
-            '.popup',
-            '.modal',
-            '.cookie-notice',
-            '[class*="ad-"]',
-            '[id*="ad-"]',
-            '[class*="ads-"]',
-            '[id*="ads-"]'
-        ]
-        
-        import json
-        for selector in unwanted_selectors:
-            try:
-                await page.evaluate(f'''
-                    (() => {{
-                        document.querySelectorAll({json.dumps(selector)}).forEach(el => el.remove());
-                    }})()
-                ''')
-            except Exception as e:
-                logger.warning(f"移除元素失敗: {e}")
-                pass  # 忽略錯誤，繼續移除其他元素
-    
-    async def _extract_main_content(self, page) -> str:
-        """提取主要內容（HTML 格式）"""
-        
-        # 嘗試常見的內容容器選擇器
-        content_selectors = [
-            'main',
-            'article', 
-            '.content',
-            '.main-content',
-            '.post-content',
-            '.article-content',
-            '.entry-content',
-            '#content',
-            '#main',
-            '.container .row',  # Bootstrap 佈局
-            '.content-wrapper'
-        ]
-        
-        import json
-        for selector in content_selectors:
+
+    @staticmethod
+    def _clean_text(text_content: str) -> str:
+        """移除多餘的空白和換行"""
+        if not text_content:
+            return ""
+        text_content = re.sub(r'\n\s*\n', '\n\n', text_content)
+        text_content = re.sub(r'[ \t]+', ' ', text_content)
+        return text_content.strip()
+
+
+class ScraperPool:
+    """
+    長駐的 Playwright 瀏覽器池。
+    第一次爬取時才啟動 Chromium，之後所有網址共用同一個瀏覽器，
+    以固定數量的瀏覽器上下文輪流服務；每個上下文使用 N 頁後重建，避免記憶體累積，
+    閒置超過設定時間則關閉瀏覽器，下次爬取時再重新啟動。
+    必須在同一個事件迴圈上使用（即 core.event_loop 的共用背景迴圈）。
+    """
+
+    def __init__(self, size: int = None, pages_per_context: int = None,
+                 idle_timeout: float = None, headless: bool = True, timeout: int = 30000):
+        """
+        Args:
+            size: 瀏覽器上下文數量（同時爬取的頁數），預設讀取 SCRAPER_POOL_CONTEXTS（4）
+            pages_per_context: 每個上下文使用幾頁後重建，預設讀取 SCRAPER_PAGES_PER_CONTEXT（50）
+            idle_timeout: 閒置幾秒後關閉瀏覽器，預設讀取 SCRAPER_IDLE_TIMEOUT（300）
+        """
+        self.size = max(1, size or int(os.environ.get("SCRAPER_POOL_CONTEXTS", "4")))
+        self.pages_per_context = max(1, pages_per_context or int(os.environ.get("SCRAPER_PAGES_PER_CONTEXT", "50")))
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(os.environ.get("SCRAPER_IDLE_TIMEOUT", "300"))
+        self.headless = headless
+        self.timeout = timeout
+
+        self._scraper: Optional[PlaywrightScraper] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Queue] = None
+        self._browser_lock: Optional[asyncio.Lock] = None
+        # 瀏覽器每次重新啟動都遞增世代，舊世代的上下文一律重建
+        self._generation = 0
+        self._in_use = 0
+        self._last_used = time.monotonic()
+        self._idle_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._scraper is not None and self._scraper.is_connected
+
+    def _bind_loop(self) -> bool:
+        """第一次使用時綁定目前的事件迴圈；在其他迴圈呼叫時回傳 False"""
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+            self._browser_lock = asyncio.Lock()
+            self._slots = asyncio.Queue()
+            for _ in range(self.size):
+                self._slots.put_nowait({'context': None, 'pages': 0, 'generation': -1})
+        return self._loop is loop
+
+    async def _ensure_browser(self):
+        """健康檢查：瀏覽器尚未啟動或已斷線時（重新）啟動"""
+        async with self._browser_lock:
+            if self.is_running:
+                return
+            if self._scraper is not None:
+                logger.warning("Playwright 瀏覽器已斷線，重新啟動")
+                await self._scraper.close()
+            scraper = PlaywrightScraper(headless=self.headless, timeout=self.timeout)
+            await scraper.launch_browser()
+            self._scraper = scraper
+            self._generation += 1
+            logger.info(f"Playwright 瀏覽器池已啟動（{self.size} 個上下文）")
+            if self.idle_timeout > 0 and (self._idle_task is None or self._idle_task.done()):
+                self._idle_task = asyncio.create_task(self._close_when_idle())
+
+    async def _prepare_slot(self, slot: Dict[str, Any]):
+        """上下文不存在、屬於舊的瀏覽器或已達使用頁數上限時重建"""
+        if slot['context'] is not None and slot['generation'] == self._generation \
+                and slot['pages'] < self.pages_per_context:
+            return
+        if slot['context'] is not None:
             try:
-                content = await page.evaluate(f'''
-                    (() => {{
-                        const element = document.querySelector({json.dumps(selector)});
-                        return element ? element.innerHTML : null;
-                    }})()
-                ''')
-                if content and len(content.strip()) > 100:  # 確保內容不為空
-                    return content
+                await slot['context'].close()
             except Exception as e:
-                logger.warning(f"提取主要內容失敗: {e}")
-                continue
-        
-        # 如果沒有找到主要內容容器，提取 body 內容
-        try:
-            content = await page.evaluate('''
-                (() => {
-                    const body = document.querySelector("body");
-                    return body ? body.innerHTML : "";
-                })()
-            ''')
-            return content or ""
-        except Exception as e:
-            logger.warning(f"提取 body 內容失敗: {e}")
-            return ""
-    
-    async def _extract_text_content(self, page) -> str:
-        """提取純文字內容"""
-        try:
-            # 提取所有可見文字
-            text_content = await page.evaluate("""
-                () => {
-                    // 移除不需要的元素
-                    const unwantedElements = document.querySelectorAll('script, style, noscript, .ad, .ads, .advertisement');
-                    unwantedElements.forEach(el => el.remove());
-                    
-                    // 提取主要內容區域的文字
-                    const contentSelectors = ['main', 'article', '.content', '.main-content', '#content'];
-                    for (const selector of contentSelectors) {
-                        const element = document.querySelector(selector);
-                        if (element) {
-                            return element.innerText || element.textContent;
-                        }
-                    }
-                    
-                    // 回退到 body
-                    return document.body.innerText || document.body.textContent || "";
-                }
-            """)
-            
-            # 清理文字內容
-            if text_content:
-                # 移除多餘的空白和換行
-                text_content = re.sub(r'\n\s*\n', '\n\n', text_content)
-                text_content = re.sub(r'[ \t]+', ' ', text_content)
-                return text_content.strip()
-                
-            return ""
-        except Exception as e:
-            logger.error(f"提取文字內容失敗: {e}")
-            return ""
-    
-    async def _extract_tables(self, page) -> List[Dict[str, Any]]:
-        """提取表格資訊"""
-        try:
-            tables_data = await page.evaluate('''
-                () => {
-                    const tables = Array.from(document.querySelectorAll('table'));
-                    
-                    function convertTableToMarkdown(headers, rows) {
-                        if (!rows || rows.length === 0) return '';
-                        
-                        let markdown = '';
-                        
-                        // 如果有表頭
-                        if (headers && headers.length > 0) {
-                            markdown += '| ' + headers.join(' | ') + ' |\\n';
-                            markdown += '| ' + headers.map(() => '---').join(' | ') + ' |\\n';
-                        }
-                        
-                        // 表格內容
-                        rows.forEach(row => {
-                            if (row && row.length > 0) {
-                                markdown += '| ' + row.join(' | ') + ' |\\n';
-                            }
-                        });
-                        
-                        return markdown;
-                    }
-                    
-                    return tables.map((table, index) => {
-                        const rows = Array.from(table.querySelectorAll('tr'));
-                        const headers = Array.from(table.querySelectorAll('th')).map(th => th.textContent.trim());
-                        const data = rows.map(row => {
-                            const cells = Array.from(row.querySelectorAll('td, th'));
-                            return cells.map(cell => cell.textContent.trim());
-                        }).filter(row => row.length > 0);
-                        
-                        return {
-                            index: index,
-                            headers: headers,
-                            rows: data,
-                            markdown: convertTableToMarkdown(headers, data)
-                        };
-                    });
-                }
-            ''')
-            
-            return tables_data or []
-        except Exception as e:
-            logger.error(f"提取表格失敗: {e}")
-            return []
-    
-    async def _extract_images(self, page) -> List[Dict[str, str]]:
-        """提取圖片資訊"""
+                logger.warning(f"關閉瀏覽器上下文失敗: {e}")
+        slot['context'] = await self._scraper.new_context()
+        slot['pages'] = 0
+        slot['generation'] = self._generation
+
+    @asynccontextmanager
+    async def _lease(self):
+        """借用一個瀏覽器上下文，用完歸還"""
+        slot = await self._slots.get()
+        self._in_use += 1
         try:
-            images_data = await page.evaluate('''
-                () => {
-                    const images = Array.from(document.querySelectorAll('img'));
-                    return images.map(img => ({
-                        src: img.src || '',
-                        alt: img.alt || '',
-                        title: img.title || '',
-                        width: img.naturalWidth || img.width || 0,
-                        height: img.naturalHeight || img.height || 0
-                    })).filter(img => img.src && !img.src.startsWith('data:'));
-                }
-            ''')
-            
-            return images_data or []
-        except Exception as e:
-            logger.error(f"提取圖片失敗: {e}")
-            return []
+            await self._ensure_browser()
+            await self._prepare_slot(slot)
+            slot['pages'] += 1
+            yield slot['context']
+        finally:
+            self._in_use -= 1
+            self._last_used = time.monotonic()
+            self._slots.put_nowait(slot)
+
+    async def scrape(self, url: str, query: str = "") -> Dict[str, Any]:
+        """以池中的瀏覽器上下文爬取網頁，回傳格式與 PlaywrightScraper.scrape_webpage 相同"""
+        if not self._bind_loop():
+            # 不在建立瀏覽器池的事件迴圈上（例如獨立的 asyncio.run），改用一次性瀏覽器
+            async with PlaywrightScraper(headless=self.headless, timeout=self.timeout) as scraper:
+                return await scraper.scrape_webpage(url, query)
+
+        async with self._lease() as context:
+            return await self._scraper.scrape_in_context(context, url, query)
+
+    async def _close_when_idle(self):
+        """背景任務：閒置超過 idle_timeout 秒後關閉瀏覽器"""
+        check_interval = min(self.idle_timeout, 30)
+        while self.is_running:
+            await asyncio.sleep(check_interval)
+            if self._in_use == 0 and time.monotonic() - self._last_used >= self.idle_timeout:
+                await self.close(only_if_idle=True)
+
+    async def close(self, only_if_idle: bool = False):
+        """關閉瀏覽器；之後再爬取時會重新啟動"""
+        if self._browser_lock is None:
+            return
+        async with self._browser_lock:
+            # 取得鎖的期間可能有新的爬取開始，閒置關閉時需再確認一次
+            if only_if_idle and self._in_use > 0:
+                return
+            if self._scraper is not None:
+                if only_if_idle:
+                    logger.info("Playwright 瀏覽器池閒置過久，關閉瀏覽器")
+                # 關閉瀏覽器會一併關閉所有上下文，遞增世代讓各槽位下次重建
+                await self._scraper.close()
+                self._scraper = None
+                self._generation += 1
+
+
+_scraper_pool: Optional[ScraperPool] = None
+_scraper_pool_lock = threading.Lock()
+
+
+def get_scraper_pool() -> ScraperPool:
+    """取得全域共用的瀏覽器池（瀏覽器在第一次爬取時才啟動）"""
+    global _scraper_pool
+    with _scraper_pool_lock:
+        if _scraper_pool is None:
+            _scraper_pool = ScraperPool()
+        return _scraper_pool
+
+
+def shutdown_scraper_pool():
+    """程式結束時關閉瀏覽器池"""
+    from ..core.event_loop import get_background_loop
+
+    pool = _scraper_pool
+    if pool is None or not pool.is_running or not get_background_loop().is_running:
+        return
+    try:
+        get_background_loop().run(pool.close(), timeout=10)
+    except Exception as e:
+        logger.warning(f"關閉 Playwright 瀏覽器池失敗: {e}")
+
+
+atexit.register(shutdown_scraper_pool)
+
+
+async def scrape_many(urls: List[str], query: str = "", deadline: float = None,
+                      per_host_limit: int = None) -> List[Dict[str, Any]]:
+    """
+    以瀏覽器池同時爬取多個網址，總並行數受 SCRAPER_POOL_CONTEXTS 限制。
+
+    Args:
+        urls: 要爬取的網址列表
+        query: 搜尋查詢
+        deadline: 整批的時限（秒），預設讀取 SCRAPER_BATCH_DEADLINE（120）；
+                  逾時仍未完成的網址會被取消，以 status='timeout' 回傳
+        per_host_limit: 同一主機同時爬取的頁數上限，預設讀取 SCRAPER_PER_HOST_LIMIT（2）
+
+    Returns:
+        與 urls 順序相同的結果列表（格式同 scrape_webpage），部分失敗不影響其他網址
+    """
+    if not urls:
+        return []
+    if deadline is None:
+        deadline = float(os.environ.get("SCRAPER_BATCH_DEADLINE", "120"))
+    per_host_limit = max(1, per_host_limit or int(os.environ.get("SCRAPER_PER_HOST_LIMIT", "2")))
+
+    pool = get_scraper_pool()
+    host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def scrape_one(url: str) -> Dict[str, Any]:
+        # 對同一個網站保持禮貌，不同網站之間則完全並行
+        semaphore = host_semaphores.setdefault(_get_host(url), asyncio.Semaphore(per_host_limit))
+        async with semaphore:
+            return await pool.scrape(url, query)
+
+    tasks = [asyncio.ensure_future(scrape_one(url)) for url in urls]
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(f"批次爬取超過 {deadline} 秒，取消 {len(pending)} 個未完成的網址")
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    results = []
+    for url, task in zip(urls, tasks):
+        if task in pending:
+            results.append(_failed_result(url, query, 'timeout', '超過批次爬取時限'))
+        elif task.exception() is not None:
+            results.append(_failed_result(url, query, 'error', str(task.exception())))
+        else:
+            results.append(task.result())
+    return results
+
 
 # 便利函數
 async def scrape_single_page(url: str, query: str = "", headless: bool = True) -> Dict[str, Any]:
     """
-    爬取單一網頁的便利函數
+    爬取單一網頁的便利函數（每次啟動獨立的瀏覽器；Web 應用請使用 get_scraper_pool().scrape）
     
     Args:
         url: 要爬取的網址
@@ -382,39 +606,36 @@ async def fetch_webpage_playwright(urls: List[str], query: str = "") -> str:
     """
     results = []
     
-    async with PlaywrightScraper() as scraper:
-        for url in urls:
-            try:
-                page_data = await scraper.scrape_webpage(url, query)
+    for url, page_data in zip(urls, await scrape_many(urls, query)):
+        try:
+            if page_data['status'] == 'success':
+                # 格式化輸出以匹配原有工具的格式
+                formatted_content = f"# {page_data['title']}\n\n"
                 
-                if page_data['status'] == 'success':
-                    # 格式化輸出以匹配原有工具的格式
-                    formatted_content = f"# {page_data['title']}\n\n"
-                    
-                    # 添加表格（如果有）
-                    if page_data['tables']:
-                        formatted_content += "## 表格資訊\n\n"
-                        for i, table in enumerate(page_data['tables']):
-                            if table['markdown']:
-                                formatted_content += f"### 表格 {i+1}\n\n{table['markdown']}\n\n"
-                    
-                    # 添加主要內容
-                    if page_data['text_content']:
-                        formatted_content += page_data['text_content']
-                    
-                    # 添加圖片資訊（如果有）
-                    if page_data['images']:
-                        formatted_content += "\n\n## 圖片資訊\n\n"
-                        for img in page_data['images']:
-                            if img['alt'] or img['title']:
-                                formatted_content += f"![{img['alt'] or img['title']}]({img['src']})\n"
-                    
-                    results.append(f"URL: {url}\n{formatted_content}")
-                else:
-                    results.append(f"URL: {url}\n錯誤: {page_data.get('error', '未知錯誤')}")
-                    
-            except Exception as e:
-                results.append(f"URL: {url}\n錯誤: {str(e)}")
+                # 添加表格（如果有）
+                if page_data['tables']:
+                    formatted_content += "## 表格資訊\n\n"
+                    for i, table in enumerate(page_data['tables']):
+                        if table['markdown']:
+                            formatted_content += f"### 表格 {i+1}\n\n{table['markdown']}\n\n"
+                
+                # 添加主要內容
+                if page_data['text_content']:
+                    formatted_content += page_data['text_content']
+                
+                # 添加圖片資訊（如果有）
+                if page_data['images']:
+                    formatted_content += "\n\n## 圖片資訊\n\n"
+                    for img in page_data['images']:
+                        if img['alt'] or img['title']:
+                            formatted_content += f"![{img['alt'] or img['title']}]({img['src']})\n"
+                
+                results.append(f"URL: {url}\n{formatted_content}")
+            else:
+                results.append(f"URL: {url}\n錯誤: {page_data.get('error', '未知錯誤')}")
+                
+        except Exception as e:
+            results.append(f"URL: {url}\n錯誤: {str(e)}")
     
     return "\n\n" + "="*80 + "\n\n".join(results)
 
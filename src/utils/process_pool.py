@@ -0,0 +1,128 @@
+"""
+CPU 密集工作的行程池
+將 pdfplumber 解析、PDF 點陣化等會長時間佔用 GIL 的工作移出 Waitress 與背景工作線程
+"""
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組，記憶體上限不生效
+    resource = None
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_worker_count() -> int:
+    """EXTRACTION_POOL_WORKERS 未設定時，預設最多使用 4 個核心；設為 0 則停用行程池"""
+    env_value = os.environ.get("EXTRACTION_POOL_WORKERS")
+    if env_value is not None and env_value.strip() != "":
+        return max(0, int(env_value))
+    return min(4, os.cpu_count() or 1)
+
+
+def _get_worker_memory_limit_mb() -> int:
+    """EXTRACTION_WORKER_MEMORY_MB 為每個工作行程的位址空間上限，0 表示不限制"""
+    return int(os.environ.get("EXTRACTION_WORKER_MEMORY_MB", "0") or 0)
+
+
+def _init_worker(memory_limit_mb: int):
+    """工作行程初始化：套用記憶體上限，超過時該工作會收到 MemoryError"""
+    if memory_limit_mb > 0 and resource is not None:
+        limit_bytes = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+
+
+def _get_mp_context():
+    """
+    POSIX 使用 forkserver、其他平台使用 spawn。
+    Web 行程已有 Waitress 線程、事件迴圈線程與 gRPC 連線，直接 fork 可能死結；
+    兩種方式的工作行程都會重新匯入主模組，因此入口檔案不可在匯入時建立應用程式
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def get_extraction_pool() -> Optional[ProcessPoolExecutor]:
+    """取得共用的抽取行程池；停用時回傳 None"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = _get_worker_count()
+            if workers == 0:
+                return None
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=_get_mp_context(),
+                initializer=_init_worker,
+                initargs=(_get_worker_memory_limit_mb(),),
+            )
+        return _executor
+
+
+def get_extraction_pool_size() -> int:
+    """抽取行程池的工作行程數（停用時為 1，代表在目前線程依序執行）"""
+    return _get_worker_count() or 1
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """工作行程異常結束（例如被 OOM 終止）時丟棄行程池，下次呼叫時重建"""
+    global _executor
+    with _executor_lock:
+        if _executor is pool:
+            _executor = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def submit_to_extraction_pool(func: Callable[..., Any], *args) -> Future:
+    """
+    將 func(*args) 提交到抽取行程池，回傳 Future，可用來並行多個工作。
+    行程池停用時直接在目前線程執行，回傳已完成的 Future。
+    """
+    pool = get_extraction_pool()
+    if pool is None:
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    try:
+        return pool.submit(func, *args)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+
+
+def run_in_extraction_pool(func: Callable[..., Any], *args, timeout: float = None) -> Any:
+    """
+    在抽取行程池中執行 func(*args) 並等待結果。
+    func 與參數必須可被 pickle（模組層級函式）。行程池停用時直接在目前線程執行。
+    """
+    pool = get_extraction_pool()
+    try:
+        return submit_to_extraction_pool(func, *args).result(timeout=timeout)
+    except BrokenProcessPool:
+        if pool is not None:
+            _discard_pool(pool)
+        raise
+
+
+def shutdown_extraction_pool():
+    """關閉抽取行程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+atexit.register(shutdown_extraction_pool)
@@ -0,0 +1,175 @@
+"""
+Markdown 渲染快取
+詳細頁面每次瀏覽都以 codehilite（Pygments）重新渲染整段 Markdown，長答案相當耗時；
+這裡以 (類別, 資料列 id) 為鍵保存渲染後的 HTML，並以內容雜湊驗證，內容變更時自動重新渲染；
+快取未命中時由預先建好的 markdown.Markdown 物件池渲染，不必每次重新載入擴充套件
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, List, Optional
+
+MARKDOWN_EXTENSIONS = ['codehilite', 'fenced_code', 'tables']
+
+
+class MarkdownRendererPool:
+    """
+    執行緒安全的 markdown.Markdown 物件池。
+    建立 Markdown 物件需要載入並註冊每個擴充套件，這裡重複使用已建好的物件，用完 reset() 後放回池中
+    """
+
+    def __init__(self, max_idle: int = None, extensions: List[str] = None):
+        """
+        Args:
+            max_idle: 池中最多保留的閒置物件數，預設讀取 MARKDOWN_POOL_SIZE（8）；
+                      同時渲染的請求超過此數時會臨時建立物件，用完即丟棄
+            extensions: Markdown 擴充套件，預設為 MARKDOWN_EXTENSIONS
+        """
+        if max_idle is None:
+            max_idle = int(os.environ.get("MARKDOWN_POOL_SIZE", "8"))
+        self.max_idle = max_idle
+        self.extensions = list(extensions or MARKDOWN_EXTENSIONS)
+        self._idle: list = []
+        self._lock = threading.Lock()
+
+    def _build(self):
+        import markdown
+
+        return markdown.Markdown(extensions=self.extensions)
+
+    def prewarm(self, count: int = 1):
+        """預先建立 count 個物件（不超過 max_idle），讓第一個請求也不必付出建立成本"""
+        renderers = [self._build() for _ in range(min(count, self.max_idle))]
+        with self._lock:
+            self._idle.extend(renderers[:self.max_idle - len(self._idle)])
+
+    def prewarm_in_background(self, count: int = 1) -> Optional[threading.Thread]:
+        """
+        在 daemon 線程中執行 prewarm，不把載入 markdown 與 Pygments 的時間加到啟動流程；
+        MARKDOWN_POOL_PREWARM 設為 0 時不預熱，第一次渲染時才建立物件
+        """
+        if os.environ.get("MARKDOWN_POOL_PREWARM", "1") == "0":
+            return None
+        thread = threading.Thread(target=self._prewarm_safely, args=(count,),
+                                  name="markdown-pool-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def _prewarm_safely(self, count: int):
+        try:
+            self.prewarm(count)
+        except Exception as e:
+            print(f"預先建立 Markdown 物件失敗，改在第一次渲染時建立: {e}")
+
+    @contextmanager
+    def renderer(self):
+        """借出一個 Markdown 物件；離開 with 區塊時重設狀態並歸還"""
+        with self._lock:
+            md = self._idle.pop() if self._idle else None
+        if md is None:
+            md = self._build()
+        try:
+            yield md
+        finally:
+            # reset() 清除上一份文件的參考連結、HTML 暫存等狀態，避免內容混入下一個請求
+            md.reset()
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(md)
+
+    def convert(self, text: str) -> str:
+        with self.renderer() as md:
+            return md.convert(text or '')
+
+
+_markdown_pool: Optional[MarkdownRendererPool] = None
+_markdown_pool_lock = threading.Lock()
+
+
+def get_markdown_pool() -> MarkdownRendererPool:
+    """取得全域共用的 Markdown 物件池"""
+    global _markdown_pool
+    with _markdown_pool_lock:
+        if _markdown_pool is None:
+            _markdown_pool = MarkdownRendererPool()
+        return _markdown_pool
+
+
+def render_markdown_html(text: str) -> str:
+    """以網站統一的擴充套件（程式碼高亮、圍欄程式碼、表格）將 Markdown 轉成 HTML"""
+    return get_markdown_pool().convert(text)
+
+
+class RenderCache:
+    """執行緒安全的 LRU 快取：每個 (類別, id) 只保留最新內容的渲染結果"""
+
+    def __init__(self, max_entries: int = None):
+        """
+        Args:
+            max_entries: 最多保留的渲染結果數，預設讀取 RENDER_CACHE_SIZE（512），0 表示停用
+        """
+        if max_entries is None:
+            max_entries = int(os.environ.get("RENDER_CACHE_SIZE", "512"))
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, namespace: str, key: Hashable, text: Optional[str],
+               renderer: Callable[[str], Any] = render_markdown_html) -> Any:
+        """
+        回傳 text 的渲染結果；快取中同一 (namespace, key) 的內容雜湊相符時直接使用。
+
+        Args:
+            namespace: 資料類別，例如 'question_text'、'document_content'
+            key: 資料列 id
+            text: 要渲染的 Markdown
+            renderer: 渲染函式，預設為 render_markdown_html
+        """
+        text = text or ''
+        if self.max_entries <= 0:
+            return renderer(text)
+
+        cache_key = (namespace, str(key))
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] == digest:
+                self._entries.move_to_end(cache_key)
+                return entry[1]
+
+        # 渲染不持有鎖，避免長答案阻塞其他頁面
+        rendered = renderer(text)
+        with self._lock:
+            self._entries[cache_key] = (digest, rendered)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return rendered
+
+    def invalidate(self, namespace: str, key: Hashable = None):
+        """移除指定資料列（未指定 key 時移除整個類別）的渲染結果"""
+        with self._lock:
+            if key is not None:
+                self._entries.pop((namespace, str(key)), None)
+                return
+            for cache_key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_render_cache: Optional[RenderCache] = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> RenderCache:
+    """取得全域共用的渲染快取"""
+    global _render_cache
+    with _render_cache_lock:
+        if _render_cache is None:
+            _render_cache = RenderCache()
+        return _render_cache
@@ -4,55 +4,8 @@ import os
 import json
 import tempfile
 import asyncio
-import markdown
-import re
 from ..utils.markdown_utils import format_answer_text
 
-def fix_markdown_numbering(text: str) -> str:
-    """只修正明顯重複的阿拉伯數字編號問題，保持所有其他格式不變"""
-    if not text:
-        return text
-    
-    lines = text.split('\n')
-    result_lines = []
-    
-    for i, line in enumerate(lines):
-        # 檢查是否為阿拉伯數字編號行
-        arabic_match = re.match(r'^(\s*)(\d+)\.\s+(.+)$', line)
-        
-        if arabic_match:
-            indent, old_number, content = arabic_match.groups()
-            
-            # 只有在明確發現重複編號時才修正
-            should_fix = False
-            correct_number = int(old_number)
-            
-            # 向前查找同層級的最近編號
-            for j in range(i-1, max(-1, i-5), -1):
-                if j < 0 or not lines[j].strip():
-                    continue
-                    
-                prev_match = re.match(r'^(\s*)(\d+)\.\s+', lines[j])
-                if prev_match:
-                    prev_indent, prev_number = prev_match.groups()
-                    
-                    # 如果是同層級
-                    if len(prev_indent) == len(indent):
-                        expected_number = int(prev_number) + 1
-                        # 只有當編號不連續且不是正確的連續編號時才修正
-                        if int(old_number) == int(prev_number) and int(old_number) != expected_number:
-                            should_fix = True
-                            correct_number = expected_number
-                        break
-            
-            if should_fix:
-                result_lines.append(f"{indent}{correct_number}. {content}")
-            else:
-                result_lines.append(line)
-        else:
-            result_lines.append(line)
-    
-    return '\n'.join(result_lines)
 import uuid
 from pathlib import Path
 from datetime import datetime
@@ -61,8 +14,10 @@ from flask import Flask, render_template, request, abort, redirect, url_for, fla
 
 from ..core.database import DatabaseManager
 from ..core.gemini_client import GeminiClient
+from ..core.event_loop import get_background_loop
 from ..flows.flow_manager import FlowManager
 from .async_processor import AsyncProcessor
+from ..utils.render_cache import get_render_cache, get_markdown_pool
 
 def create_app():
     # --- App Initialization ---
@@ -80,14 +35,24 @@ def create_app():
     app.secret_key = secret_key
 
     # --- Database and Services Initialization ---
+    # 所有流程共用同一個長駐事件迴圈，Gemini 呼叫與網頁爬取不再每次重建迴圈
+    get_background_loop().start()
     db = DatabaseManager()
     gemini_client = GeminiClient()
     flow_manager = FlowManager(gemini_client, db)
     async_processor = AsyncProcessor(flow_manager)  # 新增非同步處理器
+    render_cache = get_render_cache()  # 詳細頁面的 Markdown 渲染快取
+    get_markdown_pool().prewarm_in_background()  # 在背景建好 Markdown 物件，不拖慢啟動，首個請求也不必載入擴充套件
+
+    def invalidate_question_html(q_id):
+        """題目被修改或刪除時移除其渲染快取"""
+        render_cache.invalidate('question_text', q_id)
+        render_cache.invalidate('question_answer', q_id)
 
     # --- File Upload Settings ---
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
     ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx', 'html', 'htm', 'md', 'jpg', 'jpeg', 'png', 'bmp', 'webp', 'gif'}
+    MAX_BATCH_URLS = int(os.environ.get("MAX_BATCH_URLS", "50"))
     # Use an absolute path for storage, default to a folder in the project root
     STORAGE_PATH = Path(os.environ.get("FILE_STORAGE_PATH", Path(app.root_path).parent.parent / "uploads"))
     
@@ -129,6 +94,19 @@ def create_app():
             
             if file and allowed_file(file.filename):
                 original_filename = secure_filename(file.filename)
+
+                # 以內容雜湊偵測重複上傳，命中時不儲存檔案也不呼叫 AI
+                from ..utils.file_processor import FileProcessor
+                content_hash = FileProcessor.compute_content_hash(file.stream)
+                existing_document = db.get_document_by_content_hash(content_hash)
+                if existing_document:
+                    flash('此檔案先前已處理過，已直接開啟既有的文件')
+                    return redirect(url_for('document_detail', doc_id=existing_document['id']))
+                active_job_id = async_processor.find_active_job(content_hash)
+                if active_job_id:
+                    flash('相同的檔案正在處理中，已為您開啟該工作')
+                    return redirect(url_for('job_status', job_id=active_job_id))
+
                 unique_filename = f"{uuid.uuid4().hex}{Path(original_filename).suffix}"
                 file_path = STORAGE_PATH / unique_filename
                 
@@ -141,6 +119,7 @@ def create_app():
                         # 非同步處理
                         job_id = async_processor.submit_job(
                             'content_processing',
+                            content_hash=content_hash,
                             file_path=str(file_path),
                             filename=original_filename,
                             subject=suggested_subject or ''
@@ -149,7 +128,8 @@ def create_app():
                         return redirect(url_for('job_status', job_id=job_id))
                     else:
                         # 同步處理（原來的方式）
-                        result = flow_manager.content_flow.process_file(str(file_path), original_filename, suggested_subject)
+                        result = flow_manager.content_flow.process_file(str(file_path), original_filename, suggested_subject,
+                                                                        content_hash=content_hash)
                         
                         if result.get('success'):
                             flash(result.get('message', '檔案處理完成！'))
@@ -217,9 +197,13 @@ def create_app():
 
             title = url_content.split('//')[-1].split('/')[0]
 
-            result = flow_manager.content_flow.complete_ai_processing(
-                web_content, title, suggested_subject, source_url=url_content
-            )
+            # 網頁內容與先前匯入的完全相同時，沿用既有文件與題目，不再呼叫 AI
+            content_hash = FileProcessor.compute_text_hash(web_content)
+            result = flow_manager.content_flow.find_duplicate_result(content_hash)
+            if result is None:
+                result = flow_manager.content_flow.complete_ai_processing(
+                    web_content, title, suggested_subject, source_url=url_content, content_hash=content_hash
+                )
             
             if result.get('success'):
                 return jsonify({
@@ -234,6 +218,45 @@ def create_app():
             app.logger.error(f"URL processing failed: {e}", exc_info=True)
             return jsonify({'error': f'系統錯誤: {str(e)}'}), 500
 
+    @app.route('/process_urls', methods=['POST'])
+    def process_urls():
+        """批次匯入網址：每個網址立即建立一個非同步工作，網頁在背景同時抓取後各自進行處理"""
+        try:
+            if request.is_json:
+                payload = request.get_json(silent=True) or {}
+                raw_urls = payload.get('urls') or []
+                suggested_subject = (payload.get('subject') or '').strip()
+            else:
+                raw_urls = request.form.get('urls', '').splitlines()
+                suggested_subject = request.form.get('subject', '').strip()
+
+            urls = []
+            for url in raw_urls:
+                url = str(url).strip()
+                if not url:
+                    continue
+                if not (url.startswith('http://') or url.startswith('https://')):
+                    url = 'https://' + url
+                if url not in urls:
+                    urls.append(url)
+
+            if not urls:
+                return jsonify({'error': '請輸入網址'}), 400
+            if len(urls) > MAX_BATCH_URLS:
+                return jsonify({'error': f'一次最多匯入 {MAX_BATCH_URLS} 個網址'}), 400
+
+            # 抓取與 AI 處理都在背景工作中進行，請求立即回傳各網址的 job_id，不受 Cloudflare 100 秒限制
+            job_ids = async_processor.submit_url_jobs(urls, suggested_subject)
+            return jsonify({
+                'success': True,
+                'message': f'已提交 {len(job_ids)} 個網址進行處理',
+                'results': [{'url': url, 'job_id': job_id} for url, job_id in job_ids.items()]
+            })
+
+        except Exception as e:
+            app.logger.error(f"Batch URL processing failed: {e}", exc_info=True)
+            return jsonify({'error': f'系統錯誤: {str(e)}'}), 500
+
     @app.route('/questions')
     def questions():
         subject = request.args.get('subject')
@@ -253,6 +276,7 @@ def create_app():
     def delete_question(q_id):
         try:
             db.delete_question(q_id)
+            invalidate_question_html(q_id)
             flash('題目已刪除')
         except Exception as e:
             app.logger.error(f"Deleting question {q_id} failed: {e}", exc_info=True)
@@ -266,6 +290,8 @@ def create_app():
             if question_ids_str:
                 # question_ids = [int(id_str) for id_str in question_ids_str] # Removed int() conversion
                 db.batch_delete_questions(question_ids_str)
+                for q_id in question_ids_str:
+                    invalidate_question_html(q_id)
                 flash(f'已刪除 {len(question_ids_str)} 個題目')
             else:
                 flash('請選擇要刪除的題目')
@@ -283,6 +309,7 @@ def create_app():
                 new_answer = request.form.get('answer_text')
                 
                 db.edit_question(q_id, new_subject, new_question, new_answer)
+                invalidate_question_html(q_id)
                 flash('題目已更新')
                 return redirect(url_for('question_detail', q_id=q_id))
             except Exception as e:
@@ -302,15 +329,15 @@ def create_app():
         if not q:
             abort(404)
         
-        md = markdown.Markdown(extensions=['codehilite', 'fenced_code', 'tables'])
-        question_html = md.convert(q.get('question_text', ''))
+        # 渲染結果依題目 id 快取，內容未變更時不再重新執行程式碼高亮
+        question_html = render_cache.render('question_text', q_id, q.get('question_text', ''))
         
         # 處理答案文本 - 暫時停用修正，測試原始渲染效果
         answer_text = q.get('answer_text', '')
         # 暫時停用編號修正
         # if answer_text:
         #     answer_text = fix_markdown_numbering(answer_text)
-        answer_html = md.convert(answer_text)
+        answer_html = render_cache.render('question_answer', q_id, answer_text)
         
         return render_template('question_detail.html', 
                              question=q, 
@@ -337,11 +364,14 @@ def create_app():
         if not job_info:
             return jsonify({'error': '找不到指定的工作'}), 404
         
-        return jsonify(job_info)
+        # 輪詢用的狀態回應不帶結果，結果請改用 /api/job/<job_id>/result 分頁讀取
+        status = {k: v for k, v in job_info.items() if k not in ('result', 'kwargs')}
+        status['has_result'] = job_info.get('result') is not None
+        return jsonify(status)
     
     @app.route('/api/job/<job_id>/result')
     def api_job_result(job_id):
-        """API: 取得工作結果"""
+        """API: 取得工作結果（題目依 document_id 從資料庫分頁讀取）"""
         job_info = async_processor.get_job_status(job_id)
         if not job_info:
             return jsonify({'error': '找不到指定的工作'}), 404
@@ -349,11 +379,39 @@ def create_app():
         if job_info['status'] != 'completed':
             return jsonify({'error': '工作尚未完成'}), 400
         
-        return jsonify({
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+        summary = job_info.get('result') or {}
+        response = {
             'success': True,
-            'result': job_info.get('result'),
-            'message': job_info.get('message', '處理完成')
-        })
+            'result': summary,
+            'message': job_info.get('message', '處理完成'),
+            'page': page,
+            'per_page': per_page,
+            'total': 0,
+            'questions': []
+        }
+        
+        document_id = summary.get('document_id') if isinstance(summary, dict) else None
+        if document_id:
+            response['total'] = db.count_questions_by_document_id(document_id)
+            response['questions'] = db.get_questions_page_by_document_id(
+                document_id, offset=(page - 1) * per_page, limit=per_page
+            )
+        response['has_next'] = page * per_page < response['total']
+        return jsonify(response)
+
+    @app.route('/api/job/<job_id>/cancel', methods=['POST'])
+    def api_job_cancel(job_id):
+        """API: 取消工作"""
+        job_info = async_processor.get_job_status(job_id)
+        if not job_info:
+            return jsonify({'error': '找不到指定的工作'}), 404
+        
+        if not async_processor.cancel_job(job_id):
+            return jsonify({'error': '工作已結束，無法取消'}), 400
+        
+        return jsonify({'success': True, 'message': '工作已取消'})
 
     @app.route('/documents')
     def documents_list():
@@ -389,6 +447,8 @@ def create_app():
                 app.logger.info(f"Deleted physical file: {document['file_path']}")
 
             db.delete_document(doc_id)
+            render_cache.invalidate('document_content', doc_id)
+            render_cache.invalidate('document_summary', doc_id)
             flash('文件已成功刪除', 'success')
         except Exception as e:
             app.logger.error(f"Deleting document {doc_id} failed: {e}", exc_info=True)
@@ -401,20 +461,19 @@ def create_app():
         if not document:
             abort(404)
         
-        original_content = ""
-        if document.get('source') and (document['source'].startswith('http://') or document['source'].startswith('https://')):
-            # If it's a URL source, use the content directly from the database
-            original_content = document.get('content', '')
-        elif document.get('file_path') and os.path.exists(document['file_path']):
-            # If it's a local file, read its content
-            from ..utils.file_processor import FileProcessor
-            original_content, _ = FileProcessor().process_input(document['file_path'])
-        else:
-            abort(404) # No valid source or file not found
+        # 擷取文字在匯入時已存入 Document.content，直接使用；只有舊資料缺少內容時才解析原始檔案
+        original_content = document.get('content') or ''
+        if not original_content:
+            is_url = document.get('source') and (document['source'].startswith('http://') or document['source'].startswith('https://'))
+            if document.get('file_path') and os.path.exists(document['file_path']):
+                from ..utils.file_processor import FileProcessor
+                # 以檔案修改時間與大小快取，檔案未變更時不會重新解析或 OCR
+                original_content = FileProcessor.extract_file_text_cached(document['file_path'])
+            elif not is_url:
+                abort(404) # No valid source or file not found
+
+        original_html = render_cache.render('document_content', doc_id, original_content)
 
-        md = markdown.Markdown(extensions=['codehilite', 'fenced_code', 'tables'])
-        original_html = md.convert(original_content)
-        
         return render_template('original_document.html', 
                              document=document, 
                              original_html=original_html)
@@ -460,9 +519,9 @@ def create_app():
             flash('此文件尚未生成學習摘要與測驗', 'warning')
             return redirect(url_for('learning_summaries'))
             
-        md = markdown.Markdown(extensions=['codehilite', 'fenced_code', 'tables'])
-        document['content'] = md.convert(document.get('content', ''))
-        document['key_points_summary'] = md.convert(document.get('key_points_summary', ''))
+        document['content'] = render_cache.render('document_content', doc_id, document.get('content', ''))
+        document['key_points_summary'] = render_cache.render('document_summary', doc_id,
+                                                             document.get('key_points_summary', ''))
         return render_template('learning_summary_detail.html', document=document)
 
     @app.route('/knowledge-graph')
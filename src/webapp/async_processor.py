@@ -10,47 +10,291 @@ import threading
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+
+from ..flows.content_flow import ProcessingCancelled
+
+# 各工作類型的預設時限（秒），可用 ASYNC_JOB_TIMEOUT_<TYPE> 環境變數覆寫
+DEFAULT_JOB_TIMEOUTS = {
+    'content_processing': 30 * 60,
+    'question_processing': 10 * 60,
+    'url_processing': 30 * 60,
+}
+
+# 已結束的工作狀態，進入後不再被背景線程覆寫
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled', 'timeout')
+
 
 class AsyncProcessor:
     """非同步處理器"""
     
-    def __init__(self, flow_manager):
+    def __init__(self, flow_manager, max_workers: int = None):
         self.flow_manager = flow_manager
         self.jobs: Dict[str, Dict[str, Any]] = {}
         self.results_dir = Path("async_results")
         self.results_dir.mkdir(exist_ok=True)
+
+        # 同時執行的工作數上限，超過的工作會以 pending 狀態排隊
+        self.max_workers = max_workers or int(os.environ.get("ASYNC_MAX_WORKERS", "2"))
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def get_job_timeout(job_type: str) -> float:
+        """取得工作類型的牆鐘時限（秒）"""
+        env_value = os.environ.get(f"ASYNC_JOB_TIMEOUT_{job_type.upper()}")
+        if env_value:
+            return float(env_value)
+        return float(DEFAULT_JOB_TIMEOUTS.get(job_type, 30 * 60))
         
-    def submit_job(self, job_type: str, **kwargs) -> str:
-        """提交非同步工作"""
+    def submit_job(self, job_type: str, content_hash: str = None, **kwargs) -> str:
+        """
+        提交非同步工作
+
+        內容處理工作會以檔案（網頁則為擷取文字）的 SHA-256 去重：相同內容若正在處理中，
+        回傳既有的 job_id；若已處理完成，建立一筆直接完成、沿用既有文件與題目的工作。
+        """
+        if job_type in ('content_processing', 'url_processing'):
+            from ..utils.file_processor import FileProcessor
+            if content_hash is None and kwargs.get('file_path'):
+                content_hash = FileProcessor.compute_content_hash(kwargs['file_path'])
+            elif content_hash is None and kwargs.get('content'):
+                content_hash = FileProcessor.compute_text_hash(kwargs['content'])
+            kwargs['content_hash'] = content_hash
+
+            active_job_id = self.find_active_job(content_hash)
+            if active_job_id:
+                return active_job_id
+
+            duplicate = self.flow_manager.content_flow.find_duplicate_result(content_hash) if content_hash else None
+            if duplicate:
+                return self._record_finished_job(job_type, duplicate, content_hash)
+
         job_id = str(uuid.uuid4())
+        job_info = self._new_job_info(job_id, job_type, kwargs, content_hash)
         
-        # 儲存工作資訊
-        job_info = {
+        with self._lock:
+            # 再次檢查，避免兩個同時送出的相同檔案各自啟動工作
+            active_job_id = self.find_active_job(content_hash)
+            if active_job_id:
+                return active_job_id
+            self.jobs[job_id] = job_info
+            self._cancel_events[job_id] = threading.Event()
+        self._save_job_status(job_id, job_info)
+        
+        self._start_job(job_id, job_type, kwargs)
+        return job_id
+
+    def _new_job_info(self, job_id: str, job_type: str, kwargs: Dict[str, Any], content_hash: str = None,
+                      message: str = '等待處理中...') -> Dict[str, Any]:
+        """建立 pending 狀態的工作資訊"""
+        return {
             'id': job_id,
             'type': job_type,
             'status': 'pending',
             'created_at': datetime.now().isoformat(),
             'progress': 0,
-            'message': '等待處理中...',
+            'message': message,
             'result': None,
             'error': None,
-            'kwargs': kwargs
+            'kwargs': kwargs,
+            'content_hash': content_hash,
+            'timeout_seconds': self.get_job_timeout(job_type)
         }
-        
-        self.jobs[job_id] = job_info
-        self._save_job_status(job_id, job_info)
-        
-        # 啟動背景線程處理
+
+    def _start_job(self, job_id: str, job_type: str, kwargs: Dict[str, Any]):
+        """啟動背景線程：排隊取得執行槽後再處理"""
         thread = threading.Thread(
-            target=self._process_job,
+            target=self._run_job,
             args=(job_id, job_type, kwargs),
             daemon=True
         )
         thread.start()
-        
+
+    def submit_url_jobs(self, urls: List[str], subject: str = '') -> Dict[str, str]:
+        """
+        批次網址匯入：立即為每個網址建立一個 url_processing 工作並回傳 {網址: job_id}，不在請求中抓取網頁。
+        背景線程同時抓取所有網址（整批時限 SCRAPER_BATCH_DEADLINE），
+        抓取成功的網址再各自排隊進行 AI 處理，失敗或逾時的網址直接結束其工作。
+        """
+        job_ids = {}
+        with self._lock:
+            for url in urls:
+                job_id = str(uuid.uuid4())
+                kwargs = {'source_url': url, 'subject': subject}
+                self.jobs[job_id] = self._new_job_info(job_id, 'url_processing', kwargs, message='等待抓取網頁...')
+                self._cancel_events[job_id] = threading.Event()
+                job_ids[url] = job_id
+        for job_id in job_ids.values():
+            self._save_job_status(job_id, self.jobs[job_id])
+
+        thread = threading.Thread(
+            target=self._fetch_url_batch,
+            args=(job_ids,),
+            daemon=True
+        )
+        thread.start()
+        return job_ids
+
+    def _fetch_url_batch(self, job_ids: Dict[str, str]):
+        """同時抓取批次中的網址，並為每個成功的網頁啟動其 url_processing 工作"""
+        from ..utils.file_processor import FileProcessor
+
+        for job_id in job_ids.values():
+            self._update_job_status(job_id, 'pending', 5, '抓取網頁中...')
+
+        try:
+            pages = FileProcessor.fetch_urls_content_sync(list(job_ids))
+        except Exception as e:
+            for job_id in job_ids.values():
+                self._update_job_status(job_id, 'failed', 0, f"網頁抓取失敗: {str(e)}", error=str(e))
+                self._release_job(job_id)
+            return
+
+        for page in pages:
+            job_id = job_ids[page['url']]
+            with self._lock:
+                job_info = self.jobs.get(job_id)
+                cancelled = job_info is None or job_info['status'] in FINISHED_STATUSES
+            if cancelled:
+                self._release_job(job_id)
+                continue
+
+            if page['status'] != 'success':
+                error = page.get('error') or '無法從該網址獲取有效內容'
+                status = 'timeout' if page['status'] == 'timeout' else 'failed'
+                self._update_job_status(job_id, status, 0, f"網頁抓取失敗: {error}", error=error)
+                self._release_job(job_id)
+                continue
+
+            # 擷取文字與先前匯入的網頁完全相同時，沿用既有文件與題目
+            content_hash = FileProcessor.compute_text_hash(page['content'])
+            duplicate = self.flow_manager.content_flow.find_duplicate_result(content_hash)
+            if duplicate:
+                self._update_job_status(job_id, 'completed', 100, duplicate.get('message', '處理完成'), result=duplicate)
+                self._release_job(job_id)
+                continue
+
+            with self._lock:
+                kwargs = job_info['kwargs']
+                kwargs.update(
+                    content=page['content'],
+                    title=page['title'] or page['url'].split('//')[-1].split('/')[0],
+                    content_hash=content_hash
+                )
+                job_info['content_hash'] = content_hash
+            self._update_job_status(job_id, 'pending', 0, '等待處理中...')
+            self._start_job(job_id, 'url_processing', kwargs)
+
+    def find_active_job(self, content_hash: Optional[str]) -> Optional[str]:
+        """找出相同內容雜湊且尚未結束的工作"""
+        if not content_hash:
+            return None
+        with self._lock:
+            for job_id, job_info in self.jobs.items():
+                if job_info.get('content_hash') == content_hash and job_info['status'] not in FINISHED_STATUSES:
+                    return job_id
+        return None
+
+    def _record_finished_job(self, job_type: str, result: Dict[str, Any], content_hash: str) -> str:
+        """為重複上傳建立一筆已完成的工作紀錄，不啟動任何處理"""
+        job_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        job_info = {
+            'id': job_id,
+            'type': job_type,
+            'status': 'completed',
+            'created_at': now,
+            'updated_at': now,
+            'progress': 100,
+            'message': result.get('message', '處理完成'),
+            'result': self.summarize_result(result),
+            'error': None,
+            'kwargs': {},
+            'content_hash': content_hash
+        }
+        with self._lock:
+            self.jobs[job_id] = job_info
+        self._save_job_status(job_id, job_info)
         return job_id
+
+    def cancel_job(self, job_id: str) -> bool:
+        """
+        要求取消工作。排隊中的工作會直接結束；執行中的工作會立即釋放執行槽，
+        背景處理則在下一個階段檢查點停止。已結束的工作回傳 False。
+        """
+        with self._lock:
+            job_info = self.jobs.get(job_id)
+            cancel_event = self._cancel_events.get(job_id)
+            if not job_info or cancel_event is None or job_info['status'] in FINISHED_STATUSES:
+                return False
+            cancel_event.set()
+        self._update_job_status(job_id, 'cancelled', job_info.get('progress', 0), '工作已取消')
+        return True
+
+    def _run_job(self, job_id: str, job_type: str, kwargs: Dict[str, Any]):
+        """取得執行槽後啟動處理線程，並監看取消要求與時限"""
+        cancel_event = self._cancel_events[job_id]
+
+        # 排隊等待執行槽，期間可被取消
+        while not self._slots.acquire(timeout=0.5):
+            if cancel_event.is_set():
+                self._release_job(job_id)
+                return
+
+        try:
+            if cancel_event.is_set():
+                return
+
+            timeout = self.get_job_timeout(job_type)
+            deadline = time.monotonic() + timeout
+            worker = threading.Thread(
+                target=self._process_job,
+                args=(job_id, job_type, kwargs),
+                daemon=True
+            )
+            worker.start()
+
+            while worker.is_alive():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # 通知處理線程停止，並標記為逾時
+                    cancel_event.set()
+                    self._update_job_status(job_id, 'timeout', 0, f'處理逾時（超過 {int(timeout)} 秒）',
+                                            error='工作超過時限')
+                    break
+                if cancel_event.wait(timeout=min(remaining, 1.0)):
+                    break
+        finally:
+            # 取消或逾時時不等待處理線程結束，立即釋放執行槽給排隊中的工作
+            self._slots.release()
+            self._release_job(job_id)
+
+    def _release_job(self, job_id: str):
+        """工作結束後移除其取消旗標"""
+        with self._lock:
+            self._cancel_events.pop(job_id, None)
     
+    @staticmethod
+    def summarize_result(result: Any) -> Any:
+        """
+        只保留結果摘要存入工作紀錄；完整題目已寫入資料庫，
+        由結果 API 依 document_id 分頁讀取，避免輪詢時序列化數 MB 的 JSON
+        """
+        if not isinstance(result, dict):
+            return result
+
+        summary = {
+            key: result[key]
+            for key in ('success', 'duplicate', 'content_type', 'subject', 'document_id', 'question_id', 'message', 'error')
+            if key in result
+        }
+        summary['question_count'] = len(result.get('questions') or [])
+        if result.get('knowledge_points'):
+            summary['knowledge_point_count'] = len(result['knowledge_points'])
+        return summary
+
     def get_job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
         """取得工作狀態"""
         if job_id in self.jobs:
@@ -61,6 +305,8 @@ class AsyncProcessor:
     
     def _process_job(self, job_id: str, job_type: str, kwargs: Dict[str, Any]):
         """處理工作的背景方法"""
+        cancel_event = self._cancel_events.get(job_id) or threading.Event()
+        kwargs = dict(kwargs, cancel_check=cancel_event.is_set)
         try:
             self._update_job_status(job_id, 'running', 10, '開始處理...')
             
@@ -68,16 +314,41 @@ class AsyncProcessor:
                 result = self._process_content(job_id, **kwargs)
             elif job_type == 'question_processing':
                 result = self._process_question(job_id, **kwargs)
+            elif job_type == 'url_processing':
+                result = self._process_url_content(job_id, **kwargs)
             else:
                 raise ValueError(f"未知的工作類型: {job_type}")
             
-            self._update_job_status(job_id, 'completed', 100, '處理完成', result=result)
+            with self._lock:
+                # 與 cancel_job 互斥：要嘛標記完成，要嘛確認工作已被取消或逾時
+                discarded = cancel_event.is_set()
+                if not discarded:
+                    self._update_job_status(job_id, 'completed', 100, '處理完成', result=result)
+            if discarded:
+                self._discard_result(job_id, result)
             
+        except ProcessingCancelled:
+            # 狀態已由 cancel_job 或時限監看設定，這裡只需結束線程
+            pass
         except Exception as e:
             error_msg = f"處理失敗: {str(e)}"
             self._update_job_status(job_id, 'failed', 0, error_msg, error=str(e))
     
-    def _process_content(self, job_id: str, file_path: str, filename: str, subject: str) -> Dict[str, Any]:
+    def _discard_result(self, job_id: str, result: Any):
+        """
+        處理流程已寫入資料庫後工作才被取消或逾時：移除新建立的文件（連同題目與內容雜湊），
+        避免工作顯示為已取消，之後的上傳卻以雜湊沿用這份文件
+        """
+        if not isinstance(result, dict) or result.get('duplicate') or not result.get('document_id'):
+            return
+        print(f"🛑 工作 {job_id} 已取消，移除已寫入的文件 {result['document_id']}")
+        try:
+            self.flow_manager.db_manager.delete_document(result['document_id'])
+        except Exception as e:
+            print(f"移除已取消工作的文件失敗: {e}")
+
+    def _process_content(self, job_id: str, file_path: str, filename: str, subject: str,
+                         cancel_check=None, content_hash: str = None) -> Dict[str, Any]:
         """處理學習內容"""
         self._update_job_status(job_id, 'running', 20, '讀取檔案內容...')
         
@@ -85,10 +356,21 @@ class AsyncProcessor:
         from ..utils.file_processor import FileProcessor
         
         try:
-            # 使用正確的方法名稱
-            content, file_type = FileProcessor.process_input(file_path)
+            # 逐頁（或逐段）讀取，邊讀邊回報進度並檢查取消要求
+            chunks = []
+            for chunk in FileProcessor.iter_input_chunks(file_path):
+                if cancel_check and cancel_check():
+                    raise ProcessingCancelled("處理已被取消")
+                chunks.append(chunk)
+                if chunk.get('total_pages'):
+                    progress = 20 + int(10 * chunk['page'] / chunk['total_pages'])
+                    self._update_job_status(job_id, 'running', progress,
+                                            f"讀取檔案內容（第 {chunk['page']}/{chunk['total_pages']} 頁）...")
+            content = FileProcessor.join_chunks(chunks)
             if not content:
                 raise Exception("無法讀取檔案內容")
+            if cancel_check and cancel_check():
+                raise ProcessingCancelled("處理已被取消")
             
             self._update_job_status(job_id, 'running', 30, '分析內容類型...')
             
@@ -96,7 +378,10 @@ class AsyncProcessor:
             result = self.flow_manager.content_flow.complete_ai_processing(
                 content=content,
                 filename=filename,
-                suggested_subject=subject
+                suggested_subject=subject,
+                file_path=file_path,
+                cancel_check=cancel_check,
+                content_hash=content_hash
             )
             
             # 模擬進度更新
@@ -116,10 +401,32 @@ class AsyncProcessor:
             
             return result
             
+        except ProcessingCancelled:
+            raise
         except Exception as e:
             raise Exception(f"內容處理失敗: {str(e)}")
     
-    def _process_question(self, job_id: str, content: str, filename: str) -> Dict[str, Any]:
+    def _process_url_content(self, job_id: str, content: str, title: str, subject: str,
+                             source_url: str, cancel_check=None, content_hash: str = None) -> Dict[str, Any]:
+        """處理已抓取的網頁內容（批次網址匯入）"""
+        self._update_job_status(job_id, 'running', 30, '分析網頁內容...')
+
+        try:
+            return self.flow_manager.content_flow.complete_ai_processing(
+                content,
+                title,
+                subject,
+                source_url=source_url,
+                cancel_check=cancel_check,
+                content_hash=content_hash
+            )
+        except ProcessingCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"網頁內容處理失敗: {str(e)}")
+
+    def _process_question(self, job_id: str, content: str, filename: str,
+                          cancel_check=None) -> Dict[str, Any]:
         """處理考題"""
         self._update_job_status(job_id, 'running', 30, '解析題目...')
         
@@ -127,7 +434,8 @@ class AsyncProcessor:
             # 使用 answer_flow 處理單一問題
             result = self.flow_manager.answer_flow.process_question_content(
                 question_content=content,
-                filename=filename
+                filename=filename,
+                cancel_check=cancel_check
             )
             
             self._update_job_status(job_id, 'running', 80, '生成答案...')
@@ -135,13 +443,20 @@ class AsyncProcessor:
             
             return result
             
+        except ProcessingCancelled:
+            raise
         except Exception as e:
             raise Exception(f"考題處理失敗: {str(e)}")
     
     def _update_job_status(self, job_id: str, status: str, progress: int, 
                           message: str, result: Any = None, error: str = None):
-        """更新工作狀態"""
-        if job_id in self.jobs:
+        """更新工作狀態（已結束的工作不會再被覆寫）"""
+        with self._lock:
+            if job_id not in self.jobs:
+                return
+            if self.jobs[job_id]['status'] in FINISHED_STATUSES:
+                return
+
             self.jobs[job_id].update({
                 'status': status,
                 'progress': progress,
@@ -150,7 +465,7 @@ class AsyncProcessor:
             })
             
             if result is not None:
-                self.jobs[job_id]['result'] = result
+                self.jobs[job_id]['result'] = self.summarize_result(result)
             if error is not None:
                 self.jobs[job_id]['error'] = error
             
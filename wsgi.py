@@ -11,11 +11,30 @@ from waitress import serve
 from dotenv import load_dotenv
 load_dotenv()
 
-app = create_app()
+_app = None
+
+
+def get_app():
+    """
+    建立 Flask 應用程式（只建立一次）。
+    不在匯入時建立：抽取行程池以 spawn / forkserver 啟動工作行程時會重新匯入本模組，
+    若在模組層級呼叫 create_app，每個工作行程都會初始化資料庫、Gemini 與背景工作
+    """
+    global _app
+    if _app is None:
+        _app = create_app()
+    return _app
+
+
+def __getattr__(name):
+    # 讓以 `模組:app` 指定應用程式的 WSGI 伺服器照常取得 app
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
     print("🚀 啟動 Waitress WSGI 伺服器...")
     print(f"🌐 應用程式運行於: http://0.0.0.0:8001")
     print("🔧 使用 Ctrl+C 停止伺服器")
     
-    serve(app, host='0.0.0.0', port=8001, threads=6)
+    serve(get_app(), host='0.0.0.0', port=8001, threads=6)